@@ -0,0 +1,84 @@
+import sys
+import os
+import glob
+import time
+
+# add parent directory to the system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from docx import Document
+from stage import translation
+from stage.translation import iter_block_items_with_images, paragraphes_de, copier_format_run, copier_format_paragraphe
+
+# formatting-heavy files of docs/input, used when no file is given
+FICHIERS = ["test_text_styles.docx", "comprehensive_test.docx", "test_table_styled.docx",
+            "test_paragraph_styles_hyperlist.docx", "231170_UserManual.docx", "REVISIONS.docx"]
+
+
+# previous copy, kept here only to compare: one python-docx property at a time
+def ancien_copier_format_run(run, new_run):
+    new_run.bold = run.bold
+    new_run.italic = run.italic
+    new_run.underline = run.underline
+    new_run.font.name = run.font.name
+    new_run.font.size = run.font.size
+    if run.font.color and run.font.color.rgb:
+        new_run.font.color.rgb = run.font.color.rgb
+    new_run.font.highlight_color = run.font.highlight_color
+    new_run.font.strike = run.font.strike
+
+
+def ancien_copier_format_paragraphe(para, new_para):
+    new_para.paragraph_format.space_before = para.paragraph_format.space_before
+    new_para.paragraph_format.space_after = para.paragraph_format.space_after
+    new_para.paragraph_format.left_indent = para.paragraph_format.left_indent
+    new_para.paragraph_format.right_indent = para.paragraph_format.right_indent
+    new_para.paragraph_format.first_line_indent = para.paragraph_format.first_line_indent
+    new_para.alignment = para.alignment
+
+
+# time of the formatting copy only (the new paragraphs and runs are created outside the measure)
+def mesurer(paragraphes, copier_paragraphe, copier_run, repetitions):
+    meilleur = None
+    for _ in range(repetitions):
+        translation.modeles_format.clear()  # every repetition starts with an empty model cache
+        cible = Document()
+        duree = 0.0
+        for para in paragraphes:
+            new_para = cible.add_paragraph()
+            new_runs = [new_para.add_run(run.text) for run in para.runs]
+            debut = time.perf_counter()
+            copier_paragraphe(para, new_para)
+            for run, new_run in zip(para.runs, new_runs):
+                copier_run(run, new_run)
+            duree += time.perf_counter() - debut
+        meilleur = duree if meilleur is None else min(meilleur, duree)
+    return meilleur
+
+
+def main():
+    dossier = sys.argv[1] if len(sys.argv) > 1 else "docs/input"
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    chemins = [os.path.join(dossier, nom) for nom in FICHIERS if os.path.exists(os.path.join(dossier, nom))]
+    if len(sys.argv) > 1 and not chemins:
+        chemins = sorted(c for c in glob.glob(os.path.join(dossier, "*.docx")) if not os.path.basename(c).startswith("~$"))
+
+    total_ancien = total_nouveau = 0.0
+    print(f"{'file':45} {'paras':>6} {'runs':>6} {'models':>7} {'old ms':>9} {'new ms':>9} {'speedup':>8}")
+    for chemin in chemins:
+        doc = Document(chemin)
+        paragraphes = [p for item in iter_block_items_with_images(doc) for p in paragraphes_de(item)]
+        runs = sum(len(p.runs) for p in paragraphes)
+        temps_ancien = mesurer(paragraphes, ancien_copier_format_paragraphe, ancien_copier_format_run, repetitions)
+        temps_nouveau = mesurer(paragraphes, copier_format_paragraphe, copier_format_run, repetitions)
+        total_ancien += temps_ancien
+        total_nouveau += temps_nouveau
+        print(f"{os.path.basename(chemin)[:45]:45} {len(paragraphes):6d} {runs:6d} {len(translation.modeles_format):7d} "
+              f"{temps_ancien * 1000:9.2f} {temps_nouveau * 1000:9.2f} {temps_ancien / max(temps_nouveau, 1e-9):7.1f}x")
+
+    print(f"{'total':45} {'':6} {'':6} {'':7} {total_ancien * 1000:9.2f} {total_nouveau * 1000:9.2f} "
+          f"{total_ancien / max(total_nouveau, 1e-9):7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
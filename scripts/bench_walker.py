@@ -0,0 +1,64 @@
+import sys
+import os
+import glob
+import time
+
+# add parent directory to the system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from docx import Document
+from docx.oxml.text.paragraph import CT_P
+from docx.oxml.table import CT_Tbl
+from docx.text.paragraph import Paragraph
+from docx.table import Table
+from stage.translation import iter_block_items_with_images
+
+
+# previous generator, kept here only to compare: serializes every paragraph to look for "w:drawing"
+def ancien_iter_block_items_with_images(doc):
+    inline_shapes = list(doc.inline_shapes)
+    current_shape_idx = 0
+
+    for block in doc.element.body.iterchildren():
+        if isinstance(block, CT_P):
+            para = Paragraph(block, doc)
+            if "w:drawing" in block.xml and current_shape_idx < len(inline_shapes):
+                yield inline_shapes[current_shape_idx]
+                current_shape_idx += 1
+            yield para
+        elif isinstance(block, CT_Tbl):
+            yield Table(block, doc)
+
+
+def mesurer(generateur, doc, repetitions):
+    debut = time.perf_counter()
+    for _ in range(repetitions):
+        nombre = sum(1 for _ in generateur(doc))
+    return (time.perf_counter() - debut) / repetitions, nombre
+
+
+# compare both walkers on every file of a folder (docs/input by default)
+def main():
+    dossier = sys.argv[1] if len(sys.argv) > 1 else "docs/input"
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    total_ancien = total_nouveau = 0.0
+    print(f"{'file':55} {'items':>6} {'old ms':>9} {'new ms':>9} {'speedup':>8}")
+    for chemin in sorted(glob.glob(os.path.join(dossier, "*.docx"))):
+        if os.path.basename(chemin).startswith("~$"):
+            continue  # word lock files
+        doc = Document(chemin)
+        temps_ancien, items_ancien = mesurer(ancien_iter_block_items_with_images, doc, repetitions)
+        temps_nouveau, items_nouveau = mesurer(iter_block_items_with_images, doc, repetitions)
+        total_ancien += temps_ancien
+        total_nouveau += temps_nouveau
+        note = "" if items_ancien == items_nouveau else f"  (old walker found {items_ancien})"
+        print(f"{os.path.basename(chemin)[:55]:55} {items_nouveau:6d} {temps_ancien * 1000:9.2f} "
+              f"{temps_nouveau * 1000:9.2f} {temps_ancien / temps_nouveau:7.1f}x{note}")
+
+    print(f"{'total':55} {'':6} {total_ancien * 1000:9.2f} {total_nouveau * 1000:9.2f} "
+          f"{total_ancien / total_nouveau:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import sys
+import os
+
+# add parent directory to the system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import glob
+import json
+import multiprocessing
+import platform
+import resource
+import time
+from io import BytesIO
+
+from docx import Document
+from stage.translation import traduire_document
+
+PHASES = ["chargement", "parcours", "collecte", "traduction", "copie_format", "copie_images", "construction",
+          "sauvegarde"]
+
+
+# one translation of a file, returns the time of every phase in seconds and the segment counts
+def mesurer_fichier(chemin, options):
+    debut = time.perf_counter()
+    doc = Document(chemin)
+    chargement = time.perf_counter() - debut
+
+    stats = {}
+    doc_traduit = traduire_document(doc, stats=stats, **options)
+
+    debut = time.perf_counter()
+    doc_traduit.save(BytesIO())  # saved in memory, the disk is not what we measure
+    sauvegarde = time.perf_counter() - debut
+
+    phases = dict(stats.get("phases", {}), chargement=chargement, sauvegarde=sauvegarde)
+    return phases, stats
+
+
+# one job alone in a fresh worker process, returns the peak resident memory of the worker in bytes
+def traduire_seul(chemin, options):
+    traduire_document(Document(chemin), **options).save(BytesIO())
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+# peak resident memory of the whole job (separate run): unlike tracemalloc it counts the C allocations too,
+# the lxml trees and the zip buffers, which are most of the memory of a document
+# the workers are forked by a small forkserver, not by this process: a child of the benchmark would start
+# with its pages counted, and a new worker per file keeps one file from raising the peak of the next
+def mesurer_memoire(pool, chemin, options):
+    return pool.apply(traduire_seul, (chemin, options))
+
+
+def benchmark(dossier, options, repetitions):
+    resultats = {}
+    pool = multiprocessing.get_context("forkserver").Pool(1, maxtasksperchild=1)
+    for chemin in sorted(glob.glob(os.path.join(dossier, "*.docx"))):
+        nom = os.path.basename(chemin)
+        if nom.startswith("~$"):
+            continue  # word lock files
+
+        meilleures = None
+        for _ in range(repetitions):  # keep the best time of each phase
+            phases, stats = mesurer_fichier(chemin, options)
+            if meilleures is None:
+                meilleures = phases
+            else:
+                meilleures = {p: min(meilleures.get(p, 0.0), phases.get(p, 0.0)) for p in meilleures}
+
+        resultats[nom] = {
+            "phases": {p: round(meilleures.get(p, 0.0), 6) for p in PHASES},
+            "total": round(sum(meilleures.get(p, 0.0) for p in PHASES), 6),
+            "segments": stats.get("segments", 0),
+            "segments_uniques": stats.get("segments_uniques", 0),
+            "caracteres": stats.get("caracteres", 0),
+            "rss_max": mesurer_memoire(pool, chemin, options),
+        }
+    pool.close()
+    pool.join()
+    return resultats
+
+
+def afficher(resultats):
+    print(f"{'file':45} {'total ms':>9} " + " ".join(f"{p[:8]:>8}" for p in PHASES) + f" {'segments':>8} {'chars':>7} {'peak RSS MB':>11}")
+    for nom, r in resultats.items():
+        print(f"{nom[:45]:45} {r['total'] * 1000:9.1f} "
+              + " ".join(f"{r['phases'][p] * 1000:8.1f}" for p in PHASES)
+              + f" {r['segments']:8d} {r['caracteres']:7d} {r['rss_max'] / 1e6:11.2f}")
+
+
+# compare with a stored baseline, a file is a regression when its total time (or peak resident memory)
+# grows more than the tolerance, a measure missing from the baseline is not compared
+def comparer(resultats, chemin_reference, tolerance):
+    with open(chemin_reference, encoding="utf-8") as f:
+        reference = json.load(f)["fichiers"]
+
+    regressions = []
+    for nom, r in resultats.items():
+        if nom not in reference:
+            continue
+        ancien = reference[nom]
+        for mesure in ("total", "rss_max"):
+            if ancien.get(mesure) and r[mesure] > ancien[mesure] * (1 + tolerance):
+                regressions.append((nom, mesure, ancien[mesure], r[mesure]))
+
+    for nom, mesure, ancien, nouveau in regressions:
+        print(f"REGRESSION {nom} {mesure}: {ancien:.6g} -> {nouveau:.6g} (+{(nouveau / ancien - 1) * 100:.0f}%)")
+    if not regressions:
+        print(f"no regression against {chemin_reference} (tolerance {tolerance * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark traduire_document on a folder of .docx files")
+    parser.add_argument("dossier", nargs="?", default="docs/input")
+    parser.add_argument("--sortie", default="bench_resultats.json", help="json file for the results")
+    parser.add_argument("--reference", help="baseline json to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a regression (0.2 = 20%%)")
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--en-place", action="store_true")
+    args = parser.parse_args()
+
+    options = {"use_mock": True, "en_place": args.en_place}
+    resultats = benchmark(args.dossier, options, args.repetitions)
+    afficher(resultats)
+
+    with open(args.sortie, "w", encoding="utf-8") as f:
+        json.dump({"python": platform.python_version(), "options": options, "fichiers": resultats}, f, indent=2)
+    print(f"results written to {args.sortie}")
+
+    if args.reference and comparer(resultats, args.reference, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,12 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from stage.translation import traduire_document
+from stage.cache import MemoireTraduction
+from stage.trace import Trace
+from stage.reprise import PointDeReprise
+from stage.metriques import METRIQUES, profiler
 from docx import Document
+import logging
 import sys
 
 # main function to translate a docx file
@@ -14,17 +19,58 @@ def main():
         print("usage : python test_docx_translation.py <fichier_entrée> <fichier_sortie>")
         sys.exit(1)
 
+    # LOG_LEVEL=DEBUG shows the detail of every table, cell and run
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "WARNING"), format="%(message)s")
+
     chemin_entree = sys.argv[1]  # get input file path
     chemin_sortie = sys.argv[2]  # get output file path
 
     print(f"loading file : {chemin_entree}")
     doc_original = Document(chemin_entree)  # load the document
 
+    # optional translation memory shared between runs (sqlite file)
+    chemin_cache = os.environ.get("TRADUCTION_CACHE")
+    cache = MemoireTraduction(chemin_cache) if chemin_cache else None
+
+    # optional json-lines trace with the timing of every batch and segment
+    trace = Trace(os.environ.get("TRADUCTION_TRACE"))
+
+    # checkpoint next to the output: a killed run started again does not send the same batches twice
+    reprise = PointDeReprise(chemin_sortie + ".reprise.jsonl")
+    if reprise.repris:
+        print(f"resuming : {reprise.repris} segment(s) already translated")
+
+    # optional profile of the translation: TRADUCTION_PROFIL=<path> writes <path>.prof and <path>.txt
+    chemin_profil = os.environ.get("TRADUCTION_PROFIL")
+
     print("starting translation")
-    doc_traduit = traduire_document(doc_original, use_mock=True)  # translate the document
+    stats = {}
+    with profiler(chemin_profil):
+        doc_traduit = traduire_document(doc_original, use_mock=True, cache=cache, stats=stats, trace=trace,
+                                        reprise=reprise)  # translate the document
+    trace.close()
+    if chemin_profil:
+        print(f"profile written to : {chemin_profil}.prof, summary in {chemin_profil}.txt")
+
+    # optional metrics of the job: TRADUCTION_METRIQUES (json) and TRADUCTION_PROMETHEUS (text file)
+    if os.environ.get("TRADUCTION_METRIQUES"):
+        METRIQUES.ecrire_json(os.environ["TRADUCTION_METRIQUES"], fichier=os.path.basename(chemin_entree),
+                              phases=stats["phases"], phases_cpu=stats["phases_cpu"])
+    if os.environ.get("TRADUCTION_PROMETHEUS"):
+        METRIQUES.ecrire_prometheus(os.environ["TRADUCTION_PROMETHEUS"])
+    print(f"segments : {stats['segments']} | unique : {stats['segments_uniques']} | calls saved : {stats['appels_evites_doublons']}")
+    if stats["segments_en_echec"]:
+        print(f"WARNING : {len(stats['segments_en_echec'])} segment(s) could not be translated and were kept as is")
+    if cache is not None:
+        print(f"translation memory : {cache.stats()}")
+        cache.close()
 
     print(f"saving translated file to : {chemin_sortie}")
     doc_traduit.save(chemin_sortie)  # save the translated document
+    if stats.get("segments_en_echec"):
+        reprise.close()  # kept, the next run only sends the failed segments
+    else:
+        reprise.supprimer()
     print("translation finished successfully")
 
 # call main function if the script is run directly
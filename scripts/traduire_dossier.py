@@ -0,0 +1,191 @@
+import sys
+import os
+
+# add parent directory to the system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import hashlib
+import json
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from docx import Document
+from stage.translation import traduire_document
+from stage.flux import traduire_fichier_en_flux
+from stage.cache import MemoireTraduction
+from stage.revision import MemoireBlocs
+from stage.reprise import PointDeReprise
+from stage import resilience
+from stage.metriques import METRIQUES, Metriques, profiler
+
+
+# hash of the input file, a file is translated again only if its content changed
+def hash_fichier(chemin):
+    h = hashlib.sha256()
+    with open(chemin, "rb") as f:
+        for bloc in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloc)
+    return h.hexdigest()
+
+
+def charger_manifest(chemin):
+    if not os.path.exists(chemin):
+        return {}
+    with open(chemin, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# written in a temp file then renamed, so a killed batch never leaves a broken manifest
+def ecrire_manifest(chemin, manifest):
+    temporaire = chemin + ".tmp"
+    with open(temporaire, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(temporaire, chemin)
+
+
+# run in a worker process: translate one file, errors are returned instead of raised
+# flux: streaming mode of stage/flux.py, for files too large to load
+# revisions: keep a sidecar of the translated blocks next to the output, a new revision of the
+#            file only translates its changed blocks
+# metriques: write the metrics of the file to <sortie>.metriques.json (they are returned in any case)
+# profil: write a cProfile dump and a cpu / memory summary to <sortie>.profil.prof and <sortie>.profil.txt
+def traduire_fichier(chemin_entree, chemin_sortie, use_mock, en_place, chemin_cache, backend=None, flux=False,
+                     revisions=False, metriques=False, profil=False):
+    debut = time.perf_counter()
+    registre = Metriques()
+    try:
+        with profiler(chemin_sortie + ".profil" if profil else None):
+            cache = MemoireTraduction(chemin_cache) if chemin_cache else None
+            reprise = PointDeReprise(chemin_sortie + ".reprise.jsonl")  # a killed batch resumes the file here
+            stats = {}
+            if flux:
+                traduire_fichier_en_flux(chemin_entree, chemin_sortie, use_mock=use_mock, cache=cache, stats=stats,
+                                         backend=backend, reprise=reprise, metriques=registre)
+            else:
+                doc = Document(chemin_entree)
+                blocs = MemoireBlocs(chemin_sortie + ".blocs.json") if revisions else None
+                doc_traduit = traduire_document(doc, use_mock=use_mock, cache=cache, stats=stats, en_place=en_place,
+                                                backend=backend, blocs=blocs, reprise=reprise, metriques=registre)
+                doc_traduit.save(chemin_sortie)
+            if stats.get("segments_en_echec"):
+                reprise.close()  # kept, the next run only sends the failed segments
+            else:
+                reprise.supprimer()
+            if cache is not None:
+                cache.close()
+        duree = time.perf_counter() - debut
+        if metriques:
+            registre.ecrire_json(chemin_sortie + ".metriques.json", fichier=os.path.basename(chemin_entree),
+                                 duree=duree, phases=stats.get("phases", {}), phases_cpu=stats.get("phases_cpu", {}))
+        return {"ok": True, "duree": duree, "stats": stats, "metriques": registre.exporter_json()}
+    except Exception as e:
+        return {"ok": False, "duree": time.perf_counter() - debut, "erreur": repr(e),
+                "trace": traceback.format_exc(), "metriques": registre.exporter_json()}
+
+
+# run once in every worker process: the rate limit is shared between the workers
+def configurer_worker(debit_par_worker):
+    resilience.limiteur.configurer(debit_par_worker)
+
+
+def fichiers_a_traduire(dossier):
+    for nom in sorted(os.listdir(dossier)):
+        if nom.endswith(".docx") and not nom.startswith("~$"):  # skip word lock files
+            yield os.path.join(dossier, nom)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="translate every .docx file of a folder")
+    parser.add_argument("dossier_entree")
+    parser.add_argument("dossier_sortie")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--manifest", help="manifest of finished files (default: <dossier_sortie>/manifest.json)")
+    parser.add_argument("--cache", help="sqlite translation memory shared by the workers")
+    parser.add_argument("--api", action="store_true", help="use the real translation API instead of the mock")
+    parser.add_argument("--backend", help="translation backend from stage/backends.py (overrides --api)")
+    parser.add_argument("--en-place", action="store_true", help="translate the text of the source document in place")
+    parser.add_argument("--flux", action="store_true",
+                        help="stream the documents with bounded memory: the text of the body, headers, footers, "
+                             "footnotes and endnotes is translated in place, every other part is copied as it is")
+    parser.add_argument("--revisions", action="store_true",
+                        help="translate only the blocks changed since the last run of a file (not with --flux)")
+    parser.add_argument("--force", action="store_true", help="translate again files already in the manifest")
+    parser.add_argument("--debit", type=float, help="api requests per second allowed for the whole batch")
+    parser.add_argument("--metriques", action="store_true",
+                        help="write the metrics of every file next to its output (<sortie>.metriques.json)")
+    parser.add_argument("--prometheus", help="prometheus text file with the metrics of the batch, updated after every file")
+    parser.add_argument("--profil", action="store_true",
+                        help="profile every file with cProfile and tracemalloc (<sortie>.profil.prof / .txt), slower")
+    args = parser.parse_args()
+
+    os.makedirs(args.dossier_sortie, exist_ok=True)
+    chemin_manifest = args.manifest or os.path.join(args.dossier_sortie, "manifest.json")
+    manifest = charger_manifest(chemin_manifest)
+
+    # only new or changed files are translated
+    taches = []
+    deja_faits = 0
+    for chemin_entree in fichiers_a_traduire(args.dossier_entree):
+        nom = os.path.basename(chemin_entree)
+        chemin_sortie = os.path.join(args.dossier_sortie, os.path.splitext(nom)[0] + "_traduit.docx")
+        empreinte = hash_fichier(chemin_entree)
+        entree = manifest.get(nom)
+        if (not args.force and entree and entree.get("statut") == "ok" and entree.get("hash") == empreinte
+                and os.path.exists(chemin_sortie)):
+            deja_faits += 1
+            continue
+        taches.append((nom, chemin_entree, chemin_sortie, empreinte))
+
+    total = len(taches)
+    print(f"{total} file(s) to translate, {deja_faits} already done and unchanged")
+    if not total:
+        return
+
+    debut = time.perf_counter()
+    termines = echecs = octets = 0
+    workers = max(1, args.workers)
+    debit_par_worker = args.debit / workers if args.debit else None
+    with ProcessPoolExecutor(max_workers=workers, initializer=configurer_worker, initargs=(debit_par_worker,)) as pool:
+        futures = {
+            pool.submit(traduire_fichier, chemin_entree, chemin_sortie, not args.api, args.en_place, args.cache,
+                        args.backend, args.flux, args.revisions, args.metriques, args.profil):
+                (nom, chemin_entree, chemin_sortie, empreinte)
+            for nom, chemin_entree, chemin_sortie, empreinte in taches
+        }
+        for future in as_completed(futures):
+            nom, chemin_entree, chemin_sortie, empreinte = futures[future]
+            resultat = future.result()
+            termines += 1
+            METRIQUES.fusionner(resultat["metriques"])  # the workers are other processes
+
+            if resultat["ok"]:
+                octets += os.path.getsize(chemin_entree)
+                # segments left untranslated: the file is written but will be translated again next run
+                nb_echecs = len(resultat["stats"].get("segments_en_echec", []))
+                statut = "partiel" if nb_echecs else "ok"
+                manifest[nom] = {"statut": statut, "hash": empreinte, "sortie": chemin_sortie,
+                                 "duree": round(resultat["duree"], 3), "stats": resultat["stats"]}
+                etat = f"{nb_echecs} segment(s) NOT translated" if nb_echecs else "ok"
+                if "taux_reutilisation" in resultat["stats"]:
+                    etat += f", {resultat['stats']['taux_reutilisation'] * 100:.0f}% reused"
+            else:
+                echecs += 1
+                manifest[nom] = {"statut": "erreur", "hash": empreinte, "erreur": resultat["erreur"]}
+                etat = f"FAILED ({resultat['erreur']})"
+            ecrire_manifest(chemin_manifest, manifest)  # after every file, so a rerun can resume
+            if args.prometheus:
+                METRIQUES.ecrire_prometheus(args.prometheus)
+
+            ecoule = time.perf_counter() - debut
+            print(f"[{termines}/{total}] {nom} : {etat} in {resultat['duree']:.2f} s | "
+                  f"{termines / ecoule:.2f} file(s)/s, {octets / ecoule / 1e6:.2f} MB/s")
+
+    print(f"done : {termines - echecs} translated, {echecs} failed, in {time.perf_counter() - debut:.1f} s")
+    if echecs:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import json
+import re
+
+from stage import utils
+
+# translation backends: each one declares its limits, traduire_lot cuts the work to fit them
+# max_lot: texts per request, max_caracteres: characters per request,
+# concurrence: requests in flight at the same time, paires: (source, target) accepted, None = any
+
+
+class Backend:
+    nom = "backend"
+    max_lot = 50
+    max_caracteres = 5000
+    concurrence = 1
+    paires = None
+
+    def accepte(self, source, cible):
+        return self.paires is None or (source, cible) in self.paires
+
+    # translate a batch of texts, the result has the same length and order
+    def traduire(self, textes, format="text", source=utils.LANGUE_SOURCE, cible=utils.LANGUE_CIBLE):
+        raise NotImplementedError
+
+
+# fake translation (reversed text), no network
+class MockBackend(Backend):
+    nom = "mock"
+    max_lot = 10000
+    max_caracteres = 10000000
+
+    def traduire(self, textes, format="text", source=utils.LANGUE_SOURCE, cible=utils.LANGUE_CIBLE):
+        mock = utils.mock_reverse_html if format == "html" else utils.mock_reverse
+        return [mock(texte) for texte in textes]
+
+
+class LibreTranslateBackend(Backend):
+    nom = "libretranslate"
+    max_lot = 50
+    max_caracteres = 5000
+    concurrence = 8
+
+    def traduire(self, textes, format="text", source=utils.LANGUE_SOURCE, cible=utils.LANGUE_CIBLE):
+        return utils.appel_api_libretranslate_lot(textes, format, source, cible)
+
+
+# offline glossary: every known term is replaced in one regex pass (longest terms first),
+# unknown words are kept, so very large documents are "translated" at memory speed
+class DictionnaireBackend(Backend):
+    max_lot = 100000
+    max_caracteres = 100000000
+
+    def __init__(self, nom, glossaire, paires=None):
+        self.nom = nom
+        self.paires = paires
+        self.glossaire = {terme.lower(): traduction for terme, traduction in glossaire.items()}
+        termes = sorted(self.glossaire, key=len, reverse=True)
+        self._motif = re.compile(
+            r"\b(?:" + "|".join(re.escape(terme) for terme in termes) + r")\b", re.IGNORECASE
+        ) if termes else None
+
+    # glossary file: json object {"term": "translation", ...}
+    @classmethod
+    def depuis_fichier(cls, nom, chemin, paires=None):
+        with open(chemin, encoding="utf-8") as f:
+            return cls(nom, json.load(f), paires)
+
+    def _remplacer(self, trouve):
+        mot = trouve.group(0)
+        traduction = self.glossaire[mot.lower()]
+        if mot[:1].isupper():
+            traduction = traduction[:1].upper() + traduction[1:]  # keep the capital of the source
+        return traduction
+
+    def traduire_un(self, texte):
+        return self._motif.sub(self._remplacer, texte) if self._motif else texte
+
+    def traduire(self, textes, format="text", source=utils.LANGUE_SOURCE, cible=utils.LANGUE_CIBLE):
+        return [self.traduire_un(texte) for texte in textes]
+
+
+# same words as traduire_texte_fr_en in stage/modif_header_footer.py
+GLOSSAIRE_FR_EN = {
+    "bonjour": "hello",
+    "et": "and",
+    "bienvenue": "welcome",
+    "merci": "thank you",
+    "pour": "for",
+    "votre": "your",
+    "lecture": "reading",
+}
+
+BACKENDS = {}
+
+
+def enregistrer_backend(backend):
+    BACKENDS[backend.nom] = backend
+    return backend
+
+
+def obtenir_backend(nom):
+    try:
+        return BACKENDS[nom]
+    except KeyError:
+        raise ValueError(f"unknown translation backend : {nom} (available : {', '.join(sorted(BACKENDS))})")
+
+
+enregistrer_backend(MockBackend())
+enregistrer_backend(LibreTranslateBackend())
+enregistrer_backend(DictionnaireBackend("dictionnaire-fr-en", GLOSSAIRE_FR_EN, paires={("fr", "en")}))
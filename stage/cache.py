@@ -0,0 +1,115 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# translation memory: a small LRU in memory in front of a sqlite file on disk
+# a key is (source language, target language, backend, sha256 of the text)
+
+
+def cle_texte(texte):
+    return hashlib.sha256(texte.encode("utf-8")).hexdigest()
+
+
+class MemoireTraduction:
+
+    def __init__(self, chemin=":memory:", taille_lru=10000, max_entrees=1000000):
+        self.taille_lru = taille_lru            # max entries kept in memory
+        self.max_entrees = max_entrees          # max entries kept on disk, oldest used are evicted
+        self.hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._verrou = threading.Lock()         # the cache is shared between translation threads
+        self._ajouts = 0
+        self._touches = {}                      # keys hit in memory -> time, written to disk at flush
+
+        self._db = sqlite3.connect(chemin, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS traductions ("
+            " source TEXT, cible TEXT, backend TEXT, hash TEXT,"
+            " traduction TEXT, dernier_acces REAL,"
+            " PRIMARY KEY (source, cible, backend, hash))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_acces ON traductions (dernier_acces)")
+        self._db.commit()
+
+    def get(self, texte, source, cible, backend):
+        cle = (source, cible, backend, cle_texte(texte))
+        with self._verrou:
+            if cle in self._lru:
+                self._lru.move_to_end(cle)
+                self._touches[cle] = time.time()  # the disk eviction must see this use too
+                self.hits += 1
+                return self._lru[cle]
+
+            ligne = self._db.execute(
+                "SELECT traduction FROM traductions WHERE source=? AND cible=? AND backend=? AND hash=?", cle
+            ).fetchone()
+            if ligne is None:
+                self.misses += 1
+                return None
+
+            self._db.execute(
+                "UPDATE traductions SET dernier_acces=? WHERE source=? AND cible=? AND backend=? AND hash=?",
+                (time.time(),) + cle
+            )
+            self._garder_en_memoire(cle, ligne[0])
+            self.hits += 1
+            return ligne[0]
+
+    def set(self, texte, traduction, source, cible, backend):
+        cle = (source, cible, backend, cle_texte(texte))
+        with self._verrou:
+            self._garder_en_memoire(cle, traduction)
+            self._db.execute(
+                "INSERT OR REPLACE INTO traductions VALUES (?, ?, ?, ?, ?, ?)",
+                cle + (traduction, time.time())
+            )
+            self._ajouts += 1
+            if self._ajouts % 1000 == 0:  # do not count the table on every insert
+                self._evincer()
+
+    # write pending rows on disk and apply the size limit
+    def flush(self):
+        with self._verrou:
+            self._evincer()
+            self._db.commit()
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "taux": self.hits / total if total else 0.0,
+            "en_memoire": len(self._lru),
+        }
+
+    def __len__(self):
+        with self._verrou:
+            return self._db.execute("SELECT COUNT(*) FROM traductions").fetchone()[0]
+
+    def _garder_en_memoire(self, cle, traduction):
+        self._lru[cle] = traduction
+        self._lru.move_to_end(cle)
+        while len(self._lru) > self.taille_lru:
+            self._lru.popitem(last=False)
+
+    def _evincer(self):
+        if self._touches:
+            self._db.executemany(
+                "UPDATE traductions SET dernier_acces=? WHERE source=? AND cible=? AND backend=? AND hash=?",
+                [(moment,) + cle for cle, moment in self._touches.items()]
+            )
+            self._touches.clear()
+        nombre = self._db.execute("SELECT COUNT(*) FROM traductions").fetchone()[0]
+        if nombre > self.max_entrees:
+            self._db.execute(
+                "DELETE FROM traductions WHERE rowid IN "
+                "(SELECT rowid FROM traductions ORDER BY dernier_acces LIMIT ?)",
+                (nombre - self.max_entrees,)
+            )
@@ -0,0 +1,119 @@
+import re
+import shutil
+import zipfile
+
+from lxml import etree
+from docx.oxml import parse_xml
+from docx.oxml.ns import qn
+from docx.oxml.parser import element_class_lookup
+from docx.text.paragraph import Paragraph
+
+from stage.translation import collecter_segments, traduire_segments, ecrire_en_place
+from stage.protection import PROTECTEUR_DEFAUT, Protecteur
+from stage.metriques import instrumenter
+
+# streaming translation of very large files: the package is never loaded with Document(),
+# word/document.xml is read with iterparse, the body blocks are translated by windows of `fenetre`
+# blocks and written at once in the output zip, so memory depends on the window, not on the document
+# the result is the one of the in place mode (same xml, only the text of the runs changes)
+
+DOCUMENT = "word/document.xml"
+# small parts with text, read whole (headers, footers, footnotes, endnotes)
+HISTOIRES = re.compile(r"^word/(header\d*|footer\d*|footnotes|endnotes)\.xml$")
+
+
+# translate in place every paragraph found in the given elements (tables, text boxes... included)
+def traduire_elements(elements, fusionner_runs, mode_paragraphe, options):
+    paragraphes = [Paragraph(p, None) for element in elements for p in element.iter(qn("w:p"))]
+    groupes_par_paragraphe, segments, segments_marques = collecter_segments(paragraphes, fusionner_runs,
+                                                                            mode_paragraphe)
+    ecrire_en_place(groupes_par_paragraphe, traduire_segments(segments, segments_marques, **options))
+
+
+# bytes around the content of `conteneur` once `copie_racine` is serialized: the opening tags (root with
+# its namespaces, body...) before, the closing tags after
+def bornes(copie_racine, conteneur):
+    repere = etree.Comment("repere")
+    conteneur.append(repere)
+    avant, apres = etree.tostring(copie_racine, encoding="UTF-8").split(b"<!--repere-->")
+    conteneur.remove(repere)
+    return avant, apres
+
+
+# write elements as children of `conteneur`: they are moved under the copy of the root, which declares every
+# namespace once, so they are serialized without the ~35 declarations each one would repeat on its own
+def ecrire_elements(sortie, copie_racine, conteneur, elements, avant, apres):
+    for element in elements:
+        conteneur.append(element)
+    xml = etree.tostring(copie_racine, encoding="UTF-8")
+    sortie.write(xml[len(avant):len(xml) - len(apres)])
+    del conteneur[:]  # written, the window is dropped
+
+
+# stream word/document.xml from the input to the output, translating `fenetre` body blocks at a time
+def traduire_corps(entree, sortie, fenetre, fusionner_runs, mode_paragraphe, options):
+    evenements = etree.iterparse(entree, events=("start", "end"), remove_blank_text=False)
+    evenements.set_element_class_lookup(element_class_lookup)  # CT_P, CT_R... like python-docx
+    racine = corps = None
+    copie_racine = copie_corps = None  # empty copies of the root and the body the written elements go under
+    blocs = []
+
+    def vider():
+        traduire_elements(blocs, fusionner_runs, mode_paragraphe, options)
+        ecrire_elements(sortie, copie_racine, copie_corps, blocs, avant_corps, apres_corps)
+        blocs.clear()
+
+    sortie.write(b"<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n")
+    for evenement, element in evenements:
+        if evenement == "start":
+            # root and body are opened in the output, their children are written one window at a time
+            if racine is None and element.tag == qn("w:document"):
+                racine = element
+                copie_racine = etree.Element(element.tag, dict(element.attrib), nsmap=element.nsmap)
+                avant_racine, apres_racine = bornes(copie_racine, copie_racine)
+                sortie.write(avant_racine)
+            elif corps is None and element.tag == qn("w:body") and element.getparent() is racine:
+                corps = element
+                copie_corps = etree.SubElement(copie_racine, element.tag, dict(element.attrib))
+                avant_corps, apres_corps = bornes(copie_racine, copie_corps)
+                sortie.write(avant_corps[len(avant_racine):])
+            continue
+        if corps is not None and element.getparent() is corps:
+            blocs.append(element)
+            if len(blocs) >= fenetre:
+                vider()
+        elif element is corps:
+            vider()
+            sortie.write(apres_corps[:len(apres_corps) - len(apres_racine)])
+            copie_racine.remove(copie_corps)
+        elif racine is not None and element.getparent() is racine:
+            # other children of the root (w:background...) are copied as they are
+            ecrire_elements(sortie, copie_racine, copie_racine, [element], avant_racine, apres_racine)
+        elif element is racine:
+            sortie.write(apres_racine)
+    del evenements
+
+
+# translate a .docx file to another one without loading it, returns the stats dict
+# options: the ones of traduire_lot (use_mock, cache, backend, source, cible, concurrence...),
+# a persistent cache avoids translating again a text already seen in an earlier window
+# metriques: optional stage.metriques.Metriques of the job
+@instrumenter("flux")
+def traduire_fichier_en_flux(chemin_entree, chemin_sortie, fenetre=200, fusionner_runs=True, mode_paragraphe=False,
+                             stats=None, termes_proteges=(), **options):
+    stats = {} if stats is None else stats
+    options = dict(options, stats=stats,
+                   protecteur=Protecteur(glossaire=termes_proteges) if termes_proteges else PROTECTEUR_DEFAUT)
+    with zipfile.ZipFile(chemin_entree) as zin, \
+            zipfile.ZipFile(chemin_sortie, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zout:
+        for info in zin.infolist():
+            with zin.open(info) as entree, zout.open(info, "w", force_zip64=True) as sortie:
+                if info.filename == DOCUMENT:
+                    traduire_corps(entree, sortie, fenetre, fusionner_runs, mode_paragraphe, options)
+                elif HISTOIRES.match(info.filename):
+                    racine = parse_xml(entree.read())
+                    traduire_elements([racine], fusionner_runs, mode_paragraphe, options)
+                    sortie.write(etree.tostring(racine, encoding="UTF-8", standalone=True))
+                else:
+                    shutil.copyfileobj(entree, sortie, 1 << 20)  # images and the rest: copied as they are
+    return stats
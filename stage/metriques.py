@@ -0,0 +1,246 @@
+import cProfile
+import functools
+import inspect
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# counters and histograms of the translation jobs (segments, characters, api calls, batch sizes,
+# cache hits, retries, latencies, time of each phase), exported as json or as a prometheus text file
+# every record goes to the registry of the process (METRIQUES) and to the registry of the current job,
+# the job registry is attached to the thread (see activer), the batch threads of traduire_lot get it too
+
+PREFIXE = "traduction_"
+SEAUX_DUREE = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SEAUX = {
+    "taille_lot_segments": (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+    "taille_lot_caracteres": (100, 500, 1000, 2000, 5000, 10000, 50000, 100000),
+}
+
+
+class Metriques:
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self.compteurs = {}     # (name, labels) -> value
+        self.histogrammes = {}  # (name, labels) -> {"bornes", "seaux" (cumulative), "somme", "nombre"}
+
+    def compter(self, nom, valeur=1, **etiquettes):
+        cle = (nom, tuple(sorted(etiquettes.items())))
+        with self._verrou:
+            self.compteurs[cle] = self.compteurs.get(cle, 0) + valeur
+
+    def observer(self, nom, valeur, **etiquettes):
+        cle = (nom, tuple(sorted(etiquettes.items())))
+        with self._verrou:
+            histogramme = self.histogrammes.get(cle)
+            if histogramme is None:
+                bornes = SEAUX.get(nom, SEAUX_DUREE)
+                histogramme = self.histogrammes[cle] = {"bornes": bornes, "seaux": [0] * len(bornes),
+                                                        "somme": 0.0, "nombre": 0}
+            for i, borne in enumerate(histogramme["bornes"]):
+                if valeur <= borne:
+                    histogramme["seaux"][i] += 1
+            histogramme["somme"] += valeur
+            histogramme["nombre"] += 1
+
+    def exporter_json(self):
+        with self._verrou:
+            return {
+                "compteurs": [{"nom": nom, "etiquettes": dict(etiquettes), "valeur": valeur}
+                              for (nom, etiquettes), valeur in sorted(self.compteurs.items())],
+                "histogrammes": [{"nom": nom, "etiquettes": dict(etiquettes), "bornes": list(h["bornes"]),
+                                  "seaux": list(h["seaux"]), "somme": h["somme"], "nombre": h["nombre"]}
+                                 for (nom, etiquettes), h in sorted(self.histogrammes.items())],
+            }
+
+    # add an export of another registry (a job run in a worker process) to this one
+    def fusionner(self, donnees):
+        for compteur in donnees.get("compteurs", []):
+            self.compter(compteur["nom"], compteur["valeur"], **compteur["etiquettes"])
+        with self._verrou:
+            for h in donnees.get("histogrammes", []):
+                cle = (h["nom"], tuple(sorted(h["etiquettes"].items())))
+                histogramme = self.histogrammes.setdefault(
+                    cle, {"bornes": tuple(h["bornes"]), "seaux": [0] * len(h["bornes"]), "somme": 0.0, "nombre": 0})
+                histogramme["seaux"] = [a + b for a, b in zip(histogramme["seaux"], h["seaux"])]
+                histogramme["somme"] += h["somme"]
+                histogramme["nombre"] += h["nombre"]
+
+    def exporter_prometheus(self):
+        donnees = self.exporter_json()
+        lignes = []
+        types_ecrits = set()
+        for compteur in donnees["compteurs"]:
+            nom = PREFIXE + compteur["nom"]
+            if nom not in types_ecrits:
+                lignes.append(f"# TYPE {nom} counter")
+                types_ecrits.add(nom)
+            lignes.append(f"{nom}{etiquettes_prometheus(compteur['etiquettes'])} {compteur['valeur']:g}")
+        for h in donnees["histogrammes"]:
+            nom = PREFIXE + h["nom"]
+            if nom not in types_ecrits:
+                lignes.append(f"# TYPE {nom} histogram")
+                types_ecrits.add(nom)
+            for borne, compte in zip(h["bornes"], h["seaux"]):
+                lignes.append(f"{nom}_bucket{etiquettes_prometheus(h['etiquettes'], le=f'{borne:g}')} {compte}")
+            lignes.append(f"{nom}_bucket{etiquettes_prometheus(h['etiquettes'], le='+Inf')} {h['nombre']}")
+            lignes.append(f"{nom}_sum{etiquettes_prometheus(h['etiquettes'])} {h['somme']:g}")
+            lignes.append(f"{nom}_count{etiquettes_prometheus(h['etiquettes'])} {h['nombre']}")
+        return "\n".join(lignes) + "\n"
+
+    # written in a temp file then renamed, the node exporter textfile collector never reads half a file
+    def ecrire_prometheus(self, chemin):
+        ecrire_atomique(chemin, self.exporter_prometheus())
+
+    def ecrire_json(self, chemin, **extra):
+        ecrire_atomique(chemin, json.dumps(dict(extra, **self.exporter_json()), indent=2, ensure_ascii=False))
+
+
+def etiquettes_prometheus(etiquettes, **autres):
+    etiquettes = dict(etiquettes, **autres)
+    if not etiquettes:
+        return ""
+    echapper = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{cle}="{echapper(valeur)}"' for cle, valeur in sorted(etiquettes.items())) + "}"
+
+
+def ecrire_atomique(chemin, texte):
+    temporaire = chemin + ".tmp"
+    with open(temporaire, "w", encoding="utf-8") as f:
+        f.write(texte)
+    os.replace(temporaire, chemin)
+
+
+# registry of the process, cumulative over every job
+METRIQUES = Metriques()
+_local = threading.local()
+
+
+def registre_courant():
+    return getattr(_local, "registre", None)
+
+
+# records of this thread also go to the given job registry (None = process registry only)
+@contextmanager
+def activer(registre):
+    precedent = registre_courant()
+    _local.registre = registre
+    try:
+        yield registre
+    finally:
+        _local.registre = precedent
+
+
+# cpu time of a job: time.thread_time() of its thread plus the time of the pool threads working for it
+# (time.process_time() would also count the other jobs the service runs at the same time)
+class TempsCpu:
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self.threads = 0.0
+
+    def ajouter(self, secondes):
+        with self._verrou:
+            self.threads += secondes
+
+
+def horloge_cpu():
+    cpu = getattr(_local, "cpu", None)
+    return time.thread_time() + (cpu.threads if cpu is not None else 0.0)
+
+
+# a function run by a pool thread for the current job: its records and its cpu time go to the job
+def pour_le_travail(fonction):
+    registre, cpu = registre_courant(), getattr(_local, "cpu", None)
+
+    @functools.wraps(fonction)
+    def enveloppe(*args, **kwargs):
+        with activer(registre):
+            debut = time.thread_time()
+            try:
+                return fonction(*args, **kwargs)
+            finally:
+                if cpu is not None:
+                    cpu.ajouter(time.thread_time() - debut)
+    return enveloppe
+
+
+def compter(nom, valeur=1, **etiquettes):
+    METRIQUES.compter(nom, valeur, **etiquettes)
+    registre = registre_courant()
+    if registre is not None and registre is not METRIQUES:
+        registre.compter(nom, valeur, **etiquettes)
+
+
+def observer(nom, valeur, **etiquettes):
+    METRIQUES.observer(nom, valeur, **etiquettes)
+    registre = registre_courant()
+    if registre is not None and registre is not METRIQUES:
+        registre.observer(nom, valeur, **etiquettes)
+
+
+# decorator of a whole job (traduire_document, traduire_fichier_en_flux): takes metriques=<job registry>,
+# counts the job, its wall and cpu time, and the time of each phase found in stats["phases"]
+# and stats["phases_cpu"] (a stats dict is given to the job when the caller has none)
+def instrumenter(type_travail):
+    def decorateur(fonction):
+        signature = inspect.signature(fonction)
+
+        @functools.wraps(fonction)
+        def enveloppe(*args, metriques=None, **kwargs):
+            arguments = signature.bind(*args, **kwargs)
+            if arguments.arguments.get("stats") is None:
+                arguments.arguments["stats"] = {}
+            stats = arguments.arguments["stats"]
+            cpu_precedent = getattr(_local, "cpu", None)
+            _local.cpu = TempsCpu()
+            with activer(metriques if metriques is not None else registre_courant()):
+                debut, debut_cpu = time.perf_counter(), horloge_cpu()
+                ok = False
+                try:
+                    resultat = fonction(*arguments.args, **arguments.kwargs)
+                    ok = True
+                    return resultat
+                finally:
+                    compter("travaux_total", type=type_travail, ok=str(ok).lower())
+                    observer("duree_travail_secondes", time.perf_counter() - debut, type=type_travail)
+                    compter("cpu_travail_secondes_total", horloge_cpu() - debut_cpu, type=type_travail)
+                    for phase, duree in stats.get("phases", {}).items():
+                        compter("phase_secondes_total", duree, phase=phase)
+                    for phase, duree in stats.get("phases_cpu", {}).items():
+                        compter("phase_cpu_secondes_total", duree, phase=phase)
+                    _local.cpu = cpu_precedent
+        return enveloppe
+    return decorateur
+
+
+# optional profiling of a block: cProfile and tracemalloc are only started when a path is given,
+# <chemin>.prof is the cProfile dump (snakeviz, pstats...), <chemin>.txt the top functions and allocations
+@contextmanager
+def profiler(chemin=None, lignes=30):
+    resultat = {}
+    if not chemin:
+        yield resultat
+        return
+    profil = cProfile.Profile()
+    tracemalloc.start()
+    profil.enable()
+    try:
+        yield resultat
+    finally:
+        profil.disable()
+        pic = tracemalloc.get_traced_memory()[1]
+        instantane = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        profil.dump_stats(chemin + ".prof")
+        with open(chemin + ".txt", "w", encoding="utf-8") as f:
+            pstats.Stats(profil, stream=f).sort_stats("cumulative").print_stats(lignes)
+            f.write(f"peak python memory: {pic / 1e6:.2f} MB\n\n")
+            for statistique in instantane.statistics("lineno")[:lignes]:
+                f.write(f"{statistique}\n")
+        resultat.update(memoire_max=pic, profil=chemin + ".prof", resume=chemin + ".txt")
@@ -0,0 +1,90 @@
+import hashlib
+import re
+
+# protected spans: emails, urls, dates, numbers, placeholders and glossary terms are replaced by
+# tokens ⟦n⟧ before translation and put back after, for any backend
+# every kind is one named group of a single compiled pattern, so a text is scanned only once
+
+JETON = re.compile(r"⟦(\d+)⟧")
+
+MOTIFS = {
+    "jeton": r"⟦\d+⟧",  # tokens of an outer protection are kept as they are
+    "email": r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+",
+    "url": r"(?:https?://|www\.)[^\s<>\"]*[^\s<>\".,;:!?)\]]",
+    "date": r"(?<!\w)\d{1,4}[/.-]\d{1,2}[/.-]\d{1,4}(?!\w)",
+    "placeholder": r"\{\{[^{}]*\}\}|\{\w+\}|%\(\w+\)[sd]|%[sd]|\[[A-Za-z][\w.]*\]|_{3,}",
+    "nombre": r"(?<!\w)[-+]?\d+(?:[.,]\d+)*%?(?!\w)",
+}
+
+TYPES_PAR_DEFAUT = ("email", "url", "date", "placeholder", "nombre")
+
+
+class Protecteur:
+
+    # types: kinds of spans to protect, glossaire: terms kept verbatim (names, brands...)
+    def __init__(self, types=TYPES_PAR_DEFAUT, glossaire=()):
+        morceaux = [f"(?P<jeton>{MOTIFS['jeton']})"]
+        termes = sorted({terme for terme in glossaire if terme}, key=len, reverse=True)
+        # what the masking depends on, part of the cache key: another glossary gives other translations
+        reglages = repr((sorted(set(types)), sorted(termes)))
+        self.signature = hashlib.sha1(reglages.encode("utf-8")).hexdigest()[:16]
+        if termes:  # before the numbers, a term can hold digits
+            morceaux.append(r"(?P<glossaire>(?<!\w)(?:" + "|".join(re.escape(t) for t in termes) + r")(?!\w))")
+        for type_ in ("email", "url", "date", "placeholder", "nombre"):
+            if type_ in types:
+                morceaux.append(f"(?P<{type_}>{MOTIFS[type_]})")
+        self._motif = re.compile("|".join(morceaux))
+
+    # returns the text with tokens and the protected values (token n -> valeurs[n])
+    # html=True: only the text between the tags is masked
+    def masquer(self, texte, html=False):
+        valeurs = {}
+        existants = [int(n) for n in JETON.findall(texte)]
+        prochain = [max(existants) + 1 if existants else 0]  # never reuse the number of an outer token
+
+        def remplacer(trouve):
+            if trouve.lastgroup == "jeton":
+                return trouve.group(0)
+            numero = prochain[0]
+            prochain[0] += 1
+            valeurs[numero] = trouve.group(0)
+            return f"⟦{numero}⟧"
+
+        if html:
+            morceaux = re.split(r"(<[^>]+>)", texte)
+            texte = "".join(m if m.startswith("<") else self._motif.sub(remplacer, m) for m in morceaux)
+        else:
+            texte = self._motif.sub(remplacer, texte)
+        return texte, valeurs
+
+    @staticmethod
+    def restaurer(texte, valeurs):
+        if not valeurs:
+            return texte
+        return JETON.sub(lambda t: valeurs.get(int(t.group(1)), t.group(0)), texte)
+
+
+# true when every token of valeurs is found exactly once in the translation
+# (a backend can drop, duplicate or rewrite a token, the protected value would then be lost or doubled)
+def jetons_intacts(traduction, valeurs):
+    if not valeurs:
+        return True
+    trouves = [int(n) for n in JETON.findall(traduction)]
+    return all(trouves.count(numero) == 1 for numero in valeurs)
+
+
+# true when nothing is left to translate once the spans are masked (no letter outside the tokens)
+def entierement_protege(texte_masque):
+    return not any(c.isalpha() for c in JETON.sub("", texte_masque))
+
+
+# mock helper: reverse the text but keep every token readable and in its reversed position
+def inverser_en_gardant_jetons(texte):
+    morceaux = JETON.split(texte)  # even indexes: text, odd indexes: token numbers
+    return "".join(
+        morceau[::-1] if i % 2 == 0 else f"⟦{morceau}⟧"
+        for i, morceau in reversed(list(enumerate(morceaux)))
+    )
+
+
+PROTECTEUR_DEFAUT = Protecteur()
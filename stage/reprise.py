@@ -0,0 +1,61 @@
+import json
+import os
+import threading
+
+from stage.cache import cle_texte
+
+# checkpoint of a translation job: every batch answered by the backend is appended at once to a
+# json-lines file, a job started again with the same file does not send these texts a second time
+# a line cut by a kill is cut off the file on reading, the file is removed once the output is saved
+
+
+class PointDeReprise:
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self.traductions = {}
+        if os.path.exists(chemin):
+            with open(chemin, "rb+") as f:
+                contenu = f.read()
+                fin = contenu.rfind(b"\n") + 1
+                if fin < len(contenu):
+                    f.truncate(fin)  # last line cut by a kill, the next records must start on a new line
+            for ligne in contenu[:fin].decode("utf-8", errors="replace").splitlines():
+                try:
+                    entree = json.loads(ligne)
+                except ValueError:
+                    continue
+                self.traductions[entree["cle"]] = entree["traduction"]
+        self.repris = len(self.traductions)  # entries found when the job started
+        self._fichier = open(chemin, "a", encoding="utf-8")
+        self._verrou = threading.Lock()  # batches finish in several threads
+
+    @staticmethod
+    def cle(texte, source, cible, backend):
+        return cle_texte("\x1f".join((source, cible, backend, texte)))
+
+    def get(self, texte, source, cible, backend):
+        return self.traductions.get(self.cle(texte, source, cible, backend))
+
+    # one batch: written and flushed to the disk before the next one is recorded
+    def ajouter_lot(self, textes, traductions, source, cible, backend):
+        lignes = []
+        for texte, traduction in zip(textes, traductions):
+            cle = self.cle(texte, source, cible, backend)
+            self.traductions[cle] = traduction
+            lignes.append(json.dumps({"cle": cle, "traduction": traduction}, ensure_ascii=False) + "\n")
+        with self._verrou:
+            self._fichier.write("".join(lignes))
+            self._fichier.flush()
+            os.fsync(self._fichier.fileno())
+
+    def close(self):
+        if self._fichier is not None:
+            self._fichier.close()
+            self._fichier = None
+
+    # the job is finished and saved, the checkpoint is not needed any more
+    def supprimer(self):
+        self.close()
+        if os.path.exists(self.chemin):
+            os.remove(self.chemin)
@@ -0,0 +1,159 @@
+import logging
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+
+from stage import metriques
+
+# protection of the translation api calls:
+# - exponential backoff with jitter between retries, Retry-After of the server is honored
+# - token bucket shared by all the threads of the process, to stay under the server rate limit
+# - circuit breaker, once the backend is clearly down the calls fail at once instead of waiting
+
+logger = logging.getLogger(__name__)
+
+MAX_TENTATIVES = 5        # attempts for one call, the first one included
+ATTENTE_INITIALE = 0.5    # seconds before the first retry, doubled at each retry
+ATTENTE_MAX = 30.0        # no wait is longer than this (Retry-After included)
+DUREE_MAX = 120.0         # no more retry once a call has been running this long
+
+CODES_REESSAYABLES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitOuvert(Exception):
+    pass
+
+
+# error worth a retry: network problem, timeout, rate limit or server error (not a bad request)
+def erreur_reessayable(erreur):
+    if isinstance(erreur, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(erreur, requests.HTTPError) and erreur.response is not None:
+        return erreur.response.status_code in CODES_REESSAYABLES
+    return False
+
+
+# error that shows the backend is down (a 429 only means it is busy, it does not open the circuit)
+def erreur_panne(erreur):
+    if isinstance(erreur, requests.HTTPError) and erreur.response is not None:
+        return erreur.response.status_code >= 500
+    return erreur_reessayable(erreur)
+
+
+# seconds asked by the server in the Retry-After header (number or http date), None if absent
+def lire_retry_after(erreur):
+    reponse = getattr(erreur, "response", None)
+    valeur = reponse.headers.get("Retry-After") if reponse is not None else None
+    if not valeur:
+        return None
+    try:
+        return max(0.0, float(valeur))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(valeur).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# tenacity wait: Retry-After when the server gives one, otherwise exponential backoff with jitter
+def attente_adaptative(retry_state):
+    erreur = retry_state.outcome.exception() if retry_state.outcome else None
+    retry_after = lire_retry_after(erreur) if erreur is not None else None
+    if retry_after is not None:
+        return min(ATTENTE_MAX, retry_after)
+    plafond = min(ATTENTE_MAX, ATTENTE_INITIALE * 2 ** (retry_state.attempt_number - 1))
+    return plafond / 2 + random.uniform(0, plafond / 2)  # jitter, so the threads do not retry all together
+
+
+# tenacity stop, reads the settings at call time so they can be changed without re-decorating
+def arret_adaptatif(retry_state):
+    return retry_state.attempt_number >= MAX_TENTATIVES or retry_state.seconds_since_start >= DUREE_MAX
+
+
+def avant_nouvel_essai(retry_state):
+    metriques.compter("nouvelles_tentatives_total")
+    logger.info("api call failed (%s), attempt %d, retrying in %.2f s", retry_state.outcome.exception(),
+                retry_state.attempt_number, retry_state.next_action.sleep)
+
+
+class SeauJetons:
+
+    def __init__(self, debit=None, capacite=None):
+        self.configurer(debit, capacite)
+        self._verrou = threading.Lock()
+
+    # debit: requests per second (None = no limit), capacite: burst allowed
+    def configurer(self, debit=None, capacite=None):
+        self.debit = debit
+        self.capacite = capacite or max(1.0, debit or 1.0)
+        self._jetons = self.capacite
+        self._dernier = time.monotonic()
+
+    # blocks until a request can be sent
+    def prendre(self):
+        if not self.debit:
+            return
+        with self._verrou:
+            maintenant = time.monotonic()
+            self._jetons = min(self.capacite, self._jetons + (maintenant - self._dernier) * self.debit)
+            self._dernier = maintenant
+            self._jetons -= 1
+            attente = -self._jetons / self.debit if self._jetons < 0 else 0.0
+        if attente:
+            time.sleep(attente)
+
+
+class Disjoncteur:
+
+    def __init__(self, seuil=5, delai=30.0):
+        self.seuil = seuil      # consecutive failures before opening
+        self.delai = delai      # seconds before a test call is let through again
+        self._verrou = threading.Lock()
+        self.reinitialiser()
+
+    def reinitialiser(self):
+        self.echecs = 0
+        self.ouvert_depuis = None
+        self._essai_en_cours = False
+
+    @property
+    def etat(self):
+        if self.ouvert_depuis is None:
+            return "ferme"
+        if time.monotonic() - self.ouvert_depuis >= self.delai:
+            return "semi-ouvert"
+        return "ouvert"
+
+    # raises CircuitOuvert when calls must not be sent; in half-open state only one test call goes through
+    def verifier(self):
+        with self._verrou:
+            etat = self.etat
+            if etat == "ferme":
+                return
+            if etat == "semi-ouvert" and not self._essai_en_cours:
+                self._essai_en_cours = True
+                return
+        raise CircuitOuvert(f"translation backend down, circuit open for {self.delai:.0f} s")
+
+    def succes(self):
+        with self._verrou:
+            self.reinitialiser()
+
+    def echec(self):
+        with self._verrou:
+            self.echecs += 1
+            self._essai_en_cours = False
+            if self.echecs >= self.seuil or self.ouvert_depuis is not None:
+                if self.ouvert_depuis is None:
+                    logger.warning("translation backend failing, circuit opened after %d errors", self.echecs)
+                self.ouvert_depuis = time.monotonic()
+
+
+# shared by every call of the process, LIBRETRANSLATE_DEBIT sets the requests per second allowed
+limiteur = SeauJetons(float(os.environ["LIBRETRANSLATE_DEBIT"]) if os.environ.get("LIBRETRANSLATE_DEBIT") else None)
+disjoncteur = Disjoncteur()
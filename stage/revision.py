@@ -0,0 +1,36 @@
+import hashlib
+import json
+import os
+
+# sidecar of a finished job: hash of the source text of every block (paragraph, table cell paragraph,
+# header paragraph...) -> its translated run groups, a new revision of the document only sends the
+# blocks that were added or changed, the others get their old translation back as it is
+
+
+class MemoireBlocs:
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self.anciens = {}
+        if os.path.exists(chemin):
+            with open(chemin, encoding="utf-8") as f:
+                self.anciens = json.load(f).get("blocs", {})
+        self.actuels = {}  # only the blocks of the new revision are written back
+
+    # contexte: what else changes a translation (backend, languages), a block of another context is not reused
+    @staticmethod
+    def cle(textes, contexte=""):
+        return hashlib.sha256("\x1f".join([contexte, *textes]).encode("utf-8")).hexdigest()
+
+    def get(self, cle):
+        return self.anciens.get(cle)
+
+    def ajouter(self, cle, traductions):
+        self.actuels[cle] = traductions
+
+    # written in a temp file then renamed, like the batch manifest
+    def enregistrer(self):
+        temporaire = self.chemin + ".tmp"
+        with open(temporaire, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "blocs": self.actuels}, f, ensure_ascii=False)
+        os.replace(temporaire, self.chemin)
@@ -0,0 +1,65 @@
+import re
+
+# long texts are cut in pieces under the request budget before they are sent, at sentence ends first,
+# then between words, then inside a word as a last resort; "".join(pieces) gives the text back exactly
+# the cut is done on the masked text (stage/protection.py), so a protected span (url, email, number)
+# is a token without any space or dot and can never be cut
+
+FIN_DE_PHRASE = re.compile(r"[.!?…؟]+[\"'»”’)\]]*\s+")
+ESPACES = re.compile(r"\s+")
+
+
+# rough size of a text for a backend counting tokens instead of characters
+def estimer_jetons(texte):
+    return len(texte) // 4 + 1
+
+
+# the text cut just after every match of the pattern (the separator stays at the end of the piece)
+def couper_apres(texte, motif):
+    debut = 0
+    for trouve in motif.finditer(texte):
+        yield texte[debut:trouve.end()]
+        debut = trouve.end()
+    if debut < len(texte):
+        yield texte[debut:]
+
+
+# a word longer than the budget is cut by characters, never inside a ⟦n⟧ token
+def couper_mot(mot, max_longueur):
+    morceaux = []
+    while len(mot) > max_longueur:
+        coupe = max_longueur
+        ouvert = mot.rfind("⟦", 0, coupe)
+        ferme = mot.find("⟧", ouvert) if ouvert >= 0 else -1
+        if ferme >= coupe:
+            # cut before the token, or after it when it starts the piece (the piece is then a bit longer)
+            coupe = ouvert if ouvert > 0 else ferme + 1
+        morceaux.append(mot[:coupe])
+        mot = mot[coupe:]
+    morceaux.append(mot)
+    return morceaux
+
+
+# pieces of at most max_longueur (measured with `mesure`, len = characters), as long as possible
+def decouper_phrases(texte, max_longueur, mesure=len):
+    if mesure(texte) <= max_longueur:
+        return [texte]
+    unites = []
+    for phrase in couper_apres(texte, FIN_DE_PHRASE):
+        if mesure(phrase.strip()) <= max_longueur:
+            unites.append(phrase)
+            continue
+        for mot in couper_apres(phrase, ESPACES):
+            if mesure(mot.strip()) <= max_longueur:
+                unites.append(mot)
+            else:
+                unites.extend(couper_mot(mot, max_longueur))
+
+    # sentences are put back together up to the budget, fewer pieces means fewer requests
+    morceaux = []
+    for unite in unites:
+        if morceaux and mesure((morceaux[-1] + unite).strip()) <= max_longueur:
+            morceaux[-1] += unite
+        else:
+            morceaux.append(unite)
+    return morceaux
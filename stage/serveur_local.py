@@ -0,0 +1,174 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from stage.utils import mock_reverse, mock_reverse_html
+
+# local stand-in for libretranslate: answers POST /translate like the real server (q can be a list),
+# with the mock as "translation", and can add latency, a throughput cap and errors to test the client
+
+
+class ServeurTraduction(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, adresse, latence=0.0, gigue=0.0, debit_max=None, max_caracteres=None,
+                 taux_429=0.0, taux_5xx=0.0, taux_timeout=0.0, duree_timeout=30.0, retry_after=1, graine=None):
+        super().__init__(adresse, Gestionnaire)
+        self.latence = latence              # seconds added to every request
+        self.gigue = gigue                  # random extra latency, between 0 and gigue seconds
+        self.debit_max = debit_max          # characters per second for the whole server, None = no cap
+        self.max_caracteres = max_caracteres  # like the char limit of libretranslate, answers 400 above it
+        self.taux_429 = taux_429            # part of the requests answered "429 too many requests"
+        self.taux_5xx = taux_5xx            # part of the requests answered with a 500/502/503
+        self.taux_timeout = taux_timeout    # part of the requests that wait duree_timeout before answering
+        self.duree_timeout = duree_timeout
+        self.retry_after = retry_after      # Retry-After header sent with the 429
+        self.hasard = random.Random(graine)
+        self.verrou = threading.Lock()
+        self.prochain_creneau = 0.0         # throughput cap: time when the server is free again
+        self.compteurs = {"requetes": 0, "textes": 0, "caracteres": 0, "429": 0, "5xx": 0, "timeout": 0}
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/translate"
+
+    def compter(self, cle, valeur=1):
+        with self.verrou:
+            self.compteurs[cle] += valeur
+
+    # wait until the server has "translated" the given number of characters at debit_max
+    def attendre_debit(self, caracteres):
+        if not self.debit_max:
+            return
+        with self.verrou:
+            debut = max(time.monotonic(), self.prochain_creneau)
+            self.prochain_creneau = debut + caracteres / self.debit_max
+            fin = self.prochain_creneau
+        time.sleep(max(0.0, fin - time.monotonic()))
+
+
+class Gestionnaire(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass  # quiet, the client logs are the interesting ones
+
+    def repondre(self, code, donnees, entetes=None):
+        corps = json.dumps(donnees, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corps)))
+        for nom, valeur in (entetes or {}).items():
+            self.send_header(nom, valeur)
+        self.end_headers()
+        self.wfile.write(corps)
+
+    def lire_requete(self):
+        corps = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            return json.loads(corps or "{}")
+        champs = parse_qs(corps)
+        donnees = {cle: valeurs[0] for cle, valeurs in champs.items()}
+        if len(champs.get("q", [])) > 1:
+            donnees["q"] = champs["q"]
+        return donnees
+
+    def do_GET(self):
+        if self.path == "/languages":
+            self.repondre(200, [{"code": "en", "name": "English"}, {"code": "ar", "name": "Arabic"}])
+        elif self.path == "/stats":
+            self.repondre(200, self.server.compteurs)
+        else:
+            self.repondre(404, {"error": "Not Found"})
+
+    def do_POST(self):
+        serveur = self.server
+        if self.path != "/translate":
+            self.repondre(404, {"error": "Not Found"})
+            return
+        serveur.compter("requetes")
+
+        try:
+            donnees = self.lire_requete()
+        except ValueError:
+            self.repondre(400, {"error": "Invalid request: bad body"})
+            return
+        q = donnees.get("q")
+        if q is None:
+            self.repondre(400, {"error": "Invalid request: missing q parameter"})
+            return
+        textes = q if isinstance(q, list) else [q]
+        caracteres = sum(len(t) for t in textes)
+        if serveur.max_caracteres and caracteres > serveur.max_caracteres:
+            self.repondre(400, {"error": f"Invalid request: request ({caracteres}) exceeds text limit ({serveur.max_caracteres})"})
+            return
+
+        # fault injection, drawn in this order on every request
+        tirage = serveur.hasard.random()
+        if tirage < serveur.taux_429:
+            serveur.compter("429")
+            self.repondre(429, {"error": "Slowdown: too many requests"}, {"Retry-After": str(serveur.retry_after)})
+            return
+        tirage -= serveur.taux_429
+        if tirage < serveur.taux_5xx:
+            serveur.compter("5xx")
+            self.repondre(serveur.hasard.choice([500, 502, 503]), {"error": "Internal server error"})
+            return
+        tirage -= serveur.taux_5xx
+        if tirage < serveur.taux_timeout:
+            serveur.compter("timeout")
+            time.sleep(serveur.duree_timeout)
+
+        time.sleep(serveur.latence + serveur.hasard.random() * serveur.gigue)
+        serveur.attendre_debit(caracteres)
+
+        mock = mock_reverse_html if donnees.get("format") == "html" else mock_reverse
+        traductions = [mock(texte) for texte in textes]
+        serveur.compter("textes", len(textes))
+        serveur.compter("caracteres", caracteres)
+        self.repondre(200, {"translatedText": traductions if isinstance(q, list) else traductions[0]})
+
+
+# start the server in a background thread (port 0 = any free port), used by the tests and the benchmarks
+def demarrer_serveur(hote="127.0.0.1", port=0, **options):
+    serveur = ServeurTraduction((hote, port), **options)
+    threading.Thread(target=serveur.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    return serveur
+
+
+def main():
+    parser = argparse.ArgumentParser(description="local libretranslate stand-in with latency and fault injection")
+    parser.add_argument("--hote", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--latence", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--gigue", type=float, default=0.0, help="random extra latency (seconds)")
+    parser.add_argument("--debit-max", type=float, help="characters per second for the whole server")
+    parser.add_argument("--max-caracteres", type=int, help="characters allowed per request")
+    parser.add_argument("--taux-429", type=float, default=0.0)
+    parser.add_argument("--taux-5xx", type=float, default=0.0)
+    parser.add_argument("--taux-timeout", type=float, default=0.0)
+    parser.add_argument("--duree-timeout", type=float, default=30.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--graine", type=int, help="random seed, to replay the same faults")
+    args = parser.parse_args()
+
+    serveur = ServeurTraduction(
+        (args.hote, args.port), latence=args.latence, gigue=args.gigue, debit_max=args.debit_max,
+        max_caracteres=args.max_caracteres, taux_429=args.taux_429, taux_5xx=args.taux_5xx,
+        taux_timeout=args.taux_timeout, duree_timeout=args.duree_timeout, retry_after=args.retry_after,
+        graine=args.graine,
+    )
+    print(f"listening on {serveur.url} (set LIBRETRANSLATE_URL to use it)")
+    try:
+        serveur.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        serveur.server_close()
+
+
+if __name__ == "__main__":
+    main()
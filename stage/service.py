@@ -0,0 +1,289 @@
+import argparse
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit
+
+from docx import Document
+
+from stage.cache import MemoireTraduction
+from stage.translation import traduire_document
+from stage.metriques import METRIQUES, Metriques
+
+# long-running translation service: .docx files are posted to POST /jobs, queued, and translated by
+# worker threads started once (imports, docx template and translation memory are already loaded),
+# GET /jobs/<id> gives the state of a job, GET /jobs/<id>/resultat the translated file,
+# GET /jobs/<id>/metriques the counters, histograms and phase times of the job (json),
+# GET /metrics the queue depth and the latencies (GET /metrics?format=prometheus: the translation counters and
+# histograms of stage/metriques.py in the prometheus text format); when the queue is full new jobs get a 503
+
+logger = logging.getLogger(__name__)
+
+TYPE_DOCX = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+class Travail:
+
+    def __init__(self, contenu, options):
+        self.id = uuid.uuid4().hex
+        self.contenu = contenu      # posted file, dropped once translated
+        self.options = options      # en_place, backend, source, cible
+        self.statut = "en_attente"  # then en_cours, termine or erreur
+        self.resultat = None
+        self.erreur = None
+        self.stats = {}
+        self.metriques = Metriques()  # counters of this job only
+        self.recu = time.monotonic()
+        self.debut = None
+        self.fin = None
+
+    def etat(self):
+        etat = {"id": self.id, "statut": self.statut}
+        if self.debut is not None:
+            etat["attente_ms"] = round((self.debut - self.recu) * 1000, 1)
+        if self.fin is not None:
+            etat["traitement_ms"] = round((self.fin - self.debut) * 1000, 1)
+            etat["segments"] = self.stats.get("segments", 0)
+            etat["segments_en_echec"] = len(self.stats.get("segments_en_echec", []))
+        if self.erreur:
+            etat["erreur"] = self.erreur
+        return etat
+
+
+# mean and percentiles of the last durations, in milliseconds
+def resumer(durees):
+    if not durees:
+        return {"nombre": 0}
+    triees = sorted(durees)
+    rang = lambda p: triees[min(len(triees) - 1, int(p * len(triees)))]
+    return {"nombre": len(triees), "moyenne": round(sum(triees) / len(triees) * 1000, 1),
+            "p50": round(rang(0.5) * 1000, 1), "p95": round(rang(0.95) * 1000, 1), "max": round(triees[-1] * 1000, 1)}
+
+
+class ServiceTraduction(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, adresse, workers=4, taille_file=100, chemin_cache=":memory:", use_mock=True, backend=None,
+                 taille_max=50 * 1024 * 1024, conserver=1000, octets_conserves=512 * 1024 * 1024):
+        super().__init__(adresse, GestionnaireService)
+        self.use_mock = use_mock
+        self.backend = backend
+        self.taille_max = taille_max    # bytes accepted for one upload
+        self.conserver = conserver      # finished jobs kept with their result, the oldest are forgotten
+        self.octets_conserves = octets_conserves  # and the bytes of the kept results (the last one is always kept)
+        self.octets = 0
+        self.cache = MemoireTraduction(chemin_cache)  # one translation memory for every worker
+        self.file = queue.Queue(maxsize=taille_file)
+        self.travaux = {}
+        self.termines = deque()
+        self.verrou = threading.Lock()
+        self.refuses = 0
+        self.durees_attente = deque(maxlen=1000)
+        self.durees_traitement = deque(maxlen=1000)
+        self.workers = [threading.Thread(target=self.travailler, daemon=True) for _ in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    # returns the job, or None when the queue is full
+    def soumettre(self, contenu, options):
+        travail = Travail(contenu, options)
+        with self.verrou:
+            self.travaux[travail.id] = travail
+        try:
+            self.file.put_nowait(travail)
+        except queue.Full:
+            with self.verrou:
+                del self.travaux[travail.id]
+                self.refuses += 1
+            return None
+        return travail
+
+    def travailler(self):
+        # warm up: first document built here, not during the first job
+        traduire_document(Document(), use_mock=True)
+        while True:
+            travail = self.file.get()
+            if travail is None:
+                break
+            travail.debut = time.monotonic()
+            travail.statut = "en_cours"
+            try:
+                doc_traduit = traduire_document(Document(BytesIO(travail.contenu)), use_mock=self.use_mock,
+                                                cache=self.cache, stats=travail.stats, metriques=travail.metriques,
+                                                backend=travail.options.get("backend") or self.backend,
+                                                **{k: v for k, v in travail.options.items() if k != "backend"})
+                sortie = BytesIO()
+                doc_traduit.save(sortie)
+                travail.resultat = sortie.getvalue()
+                travail.statut = "termine"
+            except Exception as e:
+                logger.warning("job %s failed: %s", travail.id, e)
+                travail.erreur = repr(e)
+                travail.statut = "erreur"
+            travail.contenu = None
+            travail.fin = time.monotonic()
+            with self.verrou:
+                self.durees_attente.append(travail.debut - travail.recu)
+                self.durees_traitement.append(travail.fin - travail.debut)
+                self.termines.append(travail.id)
+                self.octets += len(travail.resultat or b"")
+                while len(self.termines) > self.conserver or (len(self.termines) > 1 and
+                                                               self.octets > self.octets_conserves):
+                    oublie = self.travaux.pop(self.termines.popleft(), None)
+                    if oublie is not None:
+                        self.octets -= len(oublie.resultat or b"")
+            self.file.task_done()
+
+    def metriques(self):
+        with self.verrou:
+            statuts = {"en_attente": 0, "en_cours": 0, "termine": 0, "erreur": 0}
+            for travail in self.travaux.values():
+                statuts[travail.statut] += 1
+            return {
+                "file": self.file.qsize(),
+                "file_max": self.file.maxsize,
+                "workers": len(self.workers),
+                "travaux": dict(statuts, refuse=self.refuses),
+                "octets_resultats": self.octets,
+                "attente_ms": resumer(list(self.durees_attente)),
+                "traitement_ms": resumer(list(self.durees_traitement)),
+                "cache": self.cache.stats(),
+            }
+
+    # stop the http server, let the workers finish the queued jobs and close the cache
+    def arreter(self):
+        self.shutdown()
+        self.server_close()
+        for _ in self.workers:
+            self.file.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.cache.close()
+
+
+class GestionnaireService(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def repondre(self, code, donnees, entetes=None):
+        corps = json.dumps(donnees, ensure_ascii=False).encode("utf-8")
+        self.envoyer(code, corps, "application/json", entetes)
+
+    def envoyer(self, code, corps, type_contenu, entetes=None):
+        self.send_response(code)
+        self.send_header("Content-Type", type_contenu)
+        self.send_header("Content-Length", str(len(corps)))
+        for nom, valeur in (entetes or {}).items():
+            self.send_header(nom, valeur)
+        self.end_headers()
+        self.wfile.write(corps)
+
+    def do_POST(self):
+        service = self.server
+        adresse = urlsplit(self.path)
+        if adresse.path != "/jobs":
+            self.repondre(404, {"error": "Not Found"})
+            return
+        try:
+            taille = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            taille = -1
+        if taille < 0:
+            self.repondre(400, {"error": "invalid Content-Length"})
+            return
+        if not taille:
+            self.repondre(400, {"error": "empty body, post the .docx file as the request body"})
+            return
+        if taille > service.taille_max:
+            self.repondre(413, {"error": f"file too large ({taille} > {service.taille_max} bytes)"})
+            return
+
+        # job options in the query string: ?en_place=1&backend=...&source=en&cible=ar
+        parametres = {cle: valeurs[0] for cle, valeurs in parse_qs(adresse.query).items()}
+        options = {cle: parametres[cle] for cle in ("backend", "source", "cible") if cle in parametres}
+        if parametres.get("en_place") in ("1", "true"):
+            options["en_place"] = True
+
+        travail = service.soumettre(self.rfile.read(taille), options)
+        if travail is None:
+            self.repondre(503, {"error": "queue full, try again later"}, {"Retry-After": "1"})
+            return
+        self.repondre(202, travail.etat(), {"Location": f"/jobs/{travail.id}"})
+
+    def do_GET(self):
+        service = self.server
+        adresse = urlsplit(self.path)
+        morceaux = adresse.path.strip("/").split("/")
+        if morceaux == ["metrics"]:
+            if parse_qs(adresse.query).get("format") == ["prometheus"]:
+                self.envoyer(200, METRIQUES.exporter_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+            else:
+                self.repondre(200, service.metriques())
+            return
+        if (len(morceaux) not in (2, 3) or morceaux[0] != "jobs"
+                or (len(morceaux) == 3 and morceaux[2] not in ("resultat", "metriques"))):
+            self.repondre(404, {"error": "Not Found"})
+            return
+        with service.verrou:
+            travail = service.travaux.get(morceaux[1])
+        if travail is None:
+            self.repondre(404, {"error": "unknown job"})
+        elif len(morceaux) == 2:
+            self.repondre(200, travail.etat())
+        elif morceaux[2] == "metriques":
+            self.repondre(200, dict(travail.metriques.exporter_json(), phases=travail.stats.get("phases", {}),
+                                    phases_cpu=travail.stats.get("phases_cpu", {})))
+        elif travail.statut != "termine":
+            self.repondre(409, travail.etat())  # not ready (or failed)
+        else:
+            self.envoyer(200, travail.resultat, TYPE_DOCX,
+                         {"Content-Disposition": f'attachment; filename="{travail.id}_traduit.docx"'})
+
+
+# start the service in a background thread (port 0 = any free port), used by the tests
+def demarrer_service(hote="127.0.0.1", port=0, **options):
+    service = ServiceTraduction((hote, port), **options)
+    threading.Thread(target=service.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    return service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="translation service: POST /jobs with a .docx body")
+    parser.add_argument("--hote", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=4, help="translation threads, started once")
+    parser.add_argument("--taille-file", type=int, default=100, help="queued jobs before new ones get a 503")
+    parser.add_argument("--cache", default=":memory:", help="sqlite translation memory shared by the workers")
+    parser.add_argument("--api", action="store_true", help="use the real translation API instead of the mock")
+    parser.add_argument("--backend", help="translation backend from stage/backends.py (overrides --api)")
+    parser.add_argument("--resultats-max", type=int, default=512,
+                        help="MB of translated files kept in memory, the oldest finished jobs are forgotten first")
+    args = parser.parse_args()
+
+    logging.basicConfig(level="INFO", format="%(asctime)s %(message)s")
+    service = ServiceTraduction((args.hote, args.port), workers=args.workers, taille_file=args.taille_file,
+                                chemin_cache=args.cache, use_mock=not args.api, backend=args.backend,
+                                octets_conserves=args.resultats_max * 1024 * 1024)
+    print(f"listening on {service.url} (curl --data-binary @file.docx {service.url}/jobs)")
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.server_close()
+        service.cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+from copy import deepcopy
+
+from docx.oxml.ns import qn
+
+# styles of the rebuilt document: the source style definitions are copied into the output the first time
+# a paragraph, run or table uses them (with the styles they are based on or linked to), and the source
+# style id is resolved once, the next uses are a dict lookup (no search by name, no KeyError fallback)
+
+LIENS = ("w:basedOn", "w:link", "w:next")
+
+
+class CorrespondanceStyles:
+
+    def __init__(self, doc, doc_traduit):
+        self.source = {style.styleId: style for style in doc.styles.element.style_lst}
+        self.styles_cible = doc_traduit.styles.element
+        self.cible = {style.styleId: style for style in self.styles_cible.style_lst}
+        self.ids = {}  # source style id -> style id in the output (None = default style)
+        self.copies = 0
+
+        # default fonts, sizes and spacing of the source document
+        defauts = doc.styles.element.find(qn("w:docDefaults"))
+        if defauts is not None:
+            ancien = self.styles_cible.find(qn("w:docDefaults"))
+            if ancien is not None:
+                self.styles_cible.replace(ancien, deepcopy(defauts))
+            else:
+                self.styles_cible.insert(0, deepcopy(defauts))
+
+        # default styles of the source (used by every paragraph, run or table without a style),
+        # the output template keeps only one default of each type
+        for style in self.source.values():
+            if style.default:
+                for autre in self.cible.values():
+                    if autre.default and autre.type == style.type and autre.styleId != style.styleId:
+                        autre.default = False
+                self.resoudre(style.styleId)
+
+    # style id to use in the output for a source style id
+    def resoudre(self, style_id):
+        if style_id is None:
+            return None
+        if style_id in self.ids:
+            return self.ids[style_id]
+        self.ids[style_id] = None  # a basedOn loop stops here
+        style = self.source.get(style_id)
+        if style is None:
+            # id unknown in the source: kept only if the output has it
+            self.ids[style_id] = style_id if style_id in self.cible else None
+            return self.ids[style_id]
+
+        self.copier(style)
+        self.ids[style_id] = style_id
+        for lien in LIENS:
+            element = style.find(qn(lien))
+            if element is not None:
+                self.resoudre(element.get(qn("w:val")))
+        return style_id
+
+    # the source definition replaces the one of the output template, except for list styles:
+    # their numbering ids point to the numbering of the template, the template one is kept
+    def copier(self, style):
+        copie = deepcopy(style)
+        numPr = copie.find(f"{qn('w:pPr')}/{qn('w:numPr')}")
+        existant = self.cible.get(style.styleId)
+        if existant is not None:
+            if numPr is not None:
+                return
+            self.styles_cible.replace(existant, copie)
+        else:
+            if numPr is not None:
+                numPr.getparent().remove(numPr)
+            self.styles_cible.append(copie)
+        self.cible[style.styleId] = copie
+        self.copies += 1
@@ -0,0 +1,33 @@
+import json
+import threading
+import time
+
+# optional json-lines trace of a translation job: one line per event (batch, segment, block...)
+# when no file is given, the trace is off and `actif` lets callers skip building the events at all
+
+
+class Trace:
+
+    def __init__(self, chemin=None):
+        self.actif = chemin is not None
+        self._fichier = open(chemin, "a", encoding="utf-8") if self.actif else None
+        self._verrou = threading.Lock()
+
+    def ecrire(self, evenement, **champs):
+        if not self.actif:
+            return
+        champs["evenement"] = evenement
+        champs["t"] = round(time.time(), 6)
+        ligne = json.dumps(champs, ensure_ascii=False)
+        with self._verrou:
+            self._fichier.write(ligne + "\n")
+
+    def close(self):
+        if self._fichier is not None:
+            self._fichier.close()
+            self._fichier = None
+        self.actif = False
+
+
+# shared disabled trace, used when the caller does not give one
+TRACE_INACTIVE = Trace()
@@ -1,184 +1,556 @@
-from tenacity import retry, stop_after_attempt, wait_fixed
-import requests
 from docx import Document
-import os
 import re
+import html
+import logging
+import time
 from io import BytesIO
+from copy import deepcopy
+from lxml import etree
 from docx.oxml import parse_xml
-from docx.oxml.ns import qn
+from docx.oxml.ns import qn, nsmap
 from docx.oxml.text.paragraph import CT_P
 from docx.oxml.table import CT_Tbl
 from docx.text.paragraph import Paragraph
-from docx.table import Table
-from docx.shared import Inches
+from docx.text.run import Run
+from docx.table import Table, _Cell
 from docx.shape import InlineShape
+from docx.oxml.shape import CT_Inline
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.opc.part import XmlPart
+from docx.opc.oxml import serialize_part_xml
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 
-from stage.utils import traduire_texte  # import the translation function
+from stage.utils import traduire_lot, mock_reverse, normaliser, LANGUE_SOURCE, LANGUE_CIBLE  # import the batch translation function
+from stage.trace import TRACE_INACTIVE
+from stage.protection import PROTECTEUR_DEFAUT, Protecteur
+from stage.revision import MemoireBlocs
+from stage.styles import CorrespondanceStyles
+from stage.metriques import instrumenter, horloge_cpu
+
+logger = logging.getLogger(__name__)
 
 # this generator yields paragraphs, tables, and images in the same order they appear
-def iter_block_items_with_images(doc):
-    inline_shapes = list(doc.inline_shapes)
-    current_shape_idx = 0
+# pictures are found with an element query on each paragraph (no xml serialization),
+# every inline picture of the paragraph is yielded, before the paragraph itself
+INLINES_DU_PARAGRAPHE = etree.XPath(
+    "./w:r/w:drawing/wp:inline | ./w:hyperlink/w:r/w:drawing/wp:inline",
+    namespaces={"w": nsmap["w"], "wp": nsmap["wp"]},
+)
 
+def iter_block_items_with_images(doc):
     for block in doc.element.body.iterchildren():
         if isinstance(block, CT_P):
-            para = Paragraph(block, doc)
-            if "w:drawing" in block.xml and current_shape_idx < len(inline_shapes):
-                yield inline_shapes[current_shape_idx]
-                current_shape_idx += 1
-            yield para
+            for inline in INLINES_DU_PARAGRAPHE(block):
+                yield InlineShape(inline)
+            yield Paragraph(block, doc)
         elif isinstance(block, CT_Tbl):
             yield Table(block, doc)
 
-# fake reverse translation to simulate a translation call
-def mock_reverse(text):
-    emails = re.findall(r'\S+@\S+\.\S+', text)  # extract all emails
-    placeholders = [f"__EMAIL{i}__" for i in range(len(emails))]  # create fake tags
-
-    for email, placeholder in zip(emails, placeholders):
-        text = text.replace(email, placeholder)  # protect emails
-
-    reversed_text = text[::-1]  # reverse the text
-
-    for placeholder, email in zip(placeholders, emails):
-        reversed_placeholder = placeholder[::-1]  # reverse placeholder back
-        reversed_text = reversed_text.replace(reversed_placeholder, email)  # restore email
-
-    return reversed_text
-
-# if translation API fails, retry 3 times with 2 second wait
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
-def appel_api_libretranslate(texte):
-    response = requests.post(
-        "https://libretranslate.de/translate",
-        data={
-            "q": texte,
-            "source": "en",
-            "target": "ar",
-            "format": "text"
-        },
-        timeout=10
-    )
-    response.raise_for_status()
-    return response.json()["translatedText"]
+# text outside the body: headers, footers, footnotes, endnotes, and text boxes anywhere
+TYPES_HISTOIRES = {CT.WML_HEADER, CT.WML_FOOTER, CT.WML_FOOTNOTES, CT.WML_ENDNOTES}
+PARAGRAPHES_ZONES_TEXTE = etree.XPath(".//w:txbxContent//w:p", namespaces={"w": nsmap["w"]})
+NOMS_ENTETES = ("header", "first_page_header", "even_page_header", "footer", "first_page_footer", "even_page_footer")
+
+# parts related to the main document that hold text (each one once, even when several sections use it)
+# returns (part, root element); footnotes and endnotes are plain parts, their xml is parsed here once
+def histoires_du_document(doc):
+    histoires = {}
+    for rel in doc.part.rels.values():
+        if rel.is_external or rel.target_part.content_type not in TYPES_HISTOIRES:
+            continue
+        part = rel.target_part
+        if part.partname not in histoires:
+            histoires[part.partname] = (part, part.element if isinstance(part, XmlPart) else parse_xml(part.blob))
+    return list(histoires.values())
+
+# every paragraph outside the body flow: text boxes of the body, then all the paragraphs of the other parts
+# (tables and text boxes of a header are found the same way)
+def paragraphes_hors_corps(doc, histoires):
+    paragraphes = [Paragraph(p, doc) for p in PARAGRAPHES_ZONES_TEXTE(doc.element.body)]
+    for _, racine in histoires:
+        paragraphes.extend(Paragraph(p, doc) for p in racine.iter(qn("w:p")))
+    return paragraphes
+
+# headers and footers shown by the last section (the one of the rebuilt document), a linked one is read
+# on the section it comes from; first page and even page ones only when the document shows them
+def entetes_affiches(doc):
+    derniere = doc.sections[-1]
+    entetes = []
+    for nom in NOMS_ENTETES:
+        if nom.startswith("first_page") and not derniere.different_first_page_header_footer:
+            continue
+        if nom.startswith("even_page") and not doc.settings.odd_and_even_pages_header_footer:
+            continue
+        for section in reversed(doc.sections):
+            entete = getattr(section, nom)
+            if not entete.is_linked_to_previous:
+                entetes.append((nom, entete))
+                break
+    return entetes
+
+# a run can be merged with its neighbours only if it holds plain text (no tab, break, field, picture...)
+def run_fusionnable(run):
+    return all(child.tag in (qn("w:rPr"), qn("w:t")) for child in run._r)
+
+# key of the formatting of a run: its serialized w:rPr
+def cle_format(run):
+    rPr = run._r.rPr
+    return etree.tostring(rPr) if rPr is not None else b""
+
+# elements between two runs that do not stop a merge (spell-check marks)
+SANS_TEXTE = (qn("w:proofErr"), qn("w:lastRenderedPageBreak"))
+
+# element just before a run, spell-check marks skipped
+def precedent(r):
+    element = r.getprevious()
+    while element is not None and element.tag in SANS_TEXTE:
+        element = element.getprevious()
+    return element
+
+# group adjacent runs with the same formatting (word splits them for spell-check, revisions...),
+# only sibling runs are merged: a hyperlink, bookmark or revision between two runs keeps them apart
+def grouper_runs(runs):
+    groupes = []
+    cle_precedente = None
+    for run in runs:
+        cle = cle_format(run) if run_fusionnable(run) else None
+        if groupes and cle is not None and cle == cle_precedente and precedent(run._r) is groupes[-1][-1]._r:
+            groupes[-1].append(run)
+        else:
+            groupes.append([run])
+        cle_precedente = cle
+    return groupes
+
+def texte_groupe(groupe):
+    return "".join(run.text for run in groupe)
+
+# whole paragraph as one segment, each group inside a span so the result can be put back on the runs
+def marquer_groupes(textes):
+    return "".join(f'<span id="{i}">{html.escape(texte, quote=False)}</span>' for i, texte in enumerate(textes))
+
+# text of each group, None for a span the translation lost
+def lire_groupes(texte_marque, nombre):
+    trouves = dict(re.findall(r'<span id="(\d+)">(.*?)</span>', texte_marque, re.S))
+    return [html.unescape(trouves[str(i)]) if str(i) in trouves else None for i in range(nombre)]
+
+# paragraphs of a cell, those of nested tables included (text boxes are read by paragraphes_hors_corps)
+PARAGRAPHES_DE_CELLULE = etree.XPath(".//w:p[not(ancestor::w:txbxContent)]", namespaces={"w": nsmap["w"]})
+# runs of a paragraph, those inside a hyperlink, smart tag, insertion or content control included,
+# not the deleted ones nor the ones of a text box anchored in the paragraph (they have their own w:p)
+RUNS_DU_PARAGRAPHE = etree.XPath(
+    ".//w:r[count(ancestor::w:p) = $profondeur and not(ancestor::w:del or ancestor::w:moveFrom)]",
+    namespaces={"w": nsmap["w"]},
+)
+
+def runs_de(para):
+    profondeur = sum(1 for _ in para._p.iterancestors(qn("w:p"))) + 1
+    return [Run(r, para) for r in RUNS_DU_PARAGRAPHE(para._p, profondeur=profondeur)]
+
+# table cells are read on the w:tc elements (row.cells is slow and repeats merged cells)
+def paragraphes_de(item):
+    if isinstance(item, Paragraph):
+        yield item
+    elif isinstance(item, Table):
+        for tr in item._tbl.tr_lst:
+            for tc in tr.tc_lst:
+                cell = _Cell(tc, item)
+                for p in PARAGRAPHES_DE_CELLULE(tc):
+                    yield Paragraph(p, cell)
+
+# first pass: gather the text of every run group (body paragraphs and table cells) in document order
+# returns the run groups of each paragraph, the plain segments and the marked paragraph segments
+def collecter_segments(items, fusionner_runs=True, mode_paragraphe=False):
+    groupes_par_paragraphe = {}
+    segments = []
+    segments_marques = []
+    for item in items:
+        for para in paragraphes_de(item):
+            runs = runs_de(para)
+            groupes = grouper_runs(runs) if fusionner_runs else [[run] for run in runs]
+            groupes_par_paragraphe[para._p] = groupes
+            if mode_paragraphe and len(groupes) > 1:
+                cles = [groupe[0]._r for groupe in groupes]
+                segments_marques.append((cles, marquer_groupes([texte_groupe(g) for g in groupes])))
+            else:
+                for groupe in groupes:
+                    segments.append((groupe[0]._r, texte_groupe(groupe)))
+    return groupes_par_paragraphe, segments, segments_marques
+
+# second pass: translate the segments given by collecter_segments, returns run element -> translation
+# options are the ones of traduire_lot (use_mock, cache, stats, backend...)
+def traduire_segments(segments, segments_marques, **options):
+    textes_traduits = traduire_lot([texte for _, texte in segments], **options)
+    traductions = {r: traduction for (r, _), traduction in zip(segments, textes_traduits)}
+    if segments_marques:
+        textes_marques = traduire_lot([texte for _, texte in segments_marques], format="html", **options)
+        manquants = []  # groups whose span is missing from the answer, translated again one by one
+        for (cles, source), texte_marque in zip(segments_marques, textes_marques):
+            groupes = lire_groupes(texte_marque, len(cles))
+            for cle, texte_source, groupe in zip(cles, lire_groupes(source, len(cles)), groupes):
+                if groupe is None:
+                    manquants.append((cle, texte_source))
+                else:
+                    traductions[cle] = groupe
+        if manquants:
+            logger.warning("%d marked group(s) missing from the translation, sent again as plain text", len(manquants))
+            traductions.update(zip([cle for cle, _ in manquants],
+                                   traduire_lot([texte for _, texte in manquants], **options)))
+    return traductions
+
+# incremental mode: the blocks (paragraphs) with the same source text as in the previous revision
+# get their old translation back, returns run element -> translation and the reused characters
+def reprendre_blocs(groupes_par_paragraphe, blocs, contexte):
+    reprises = {}
+    nb_blocs = caracteres = 0
+    for groupes in groupes_par_paragraphe.values():
+        textes = [texte_groupe(groupe) for groupe in groupes]
+        if not any(texte.strip() for texte in textes):
+            continue
+        anciennes = blocs.get(MemoireBlocs.cle(textes, contexte))
+        if anciennes is not None and len(anciennes) == len(groupes):
+            reprises.update(zip((groupe[0]._r for groupe in groupes), anciennes))
+            nb_blocs += 1
+            caracteres += sum(len(texte) for texte in textes)
+    return reprises, nb_blocs, caracteres
+
+# store the translation of every block for the next revision, a block with a failed segment is not stored
+def memoriser_blocs(groupes_par_paragraphe, traductions, blocs, contexte, echecs):
+    nb_blocs = caracteres = 0
+    for groupes in groupes_par_paragraphe.values():
+        textes = [texte_groupe(groupe) for groupe in groupes]
+        if not any(texte.strip() for texte in textes):
+            continue
+        nb_blocs += 1
+        caracteres += sum(len(texte) for texte in textes)
+        if echecs and (normaliser(marquer_groupes(textes)) in echecs or any(normaliser(t) in echecs for t in textes)):
+            continue
+        blocs.ajouter(MemoireBlocs.cle(textes, contexte), [traductions.get(groupe[0]._r, "") for groupe in groupes])
+    return nb_blocs, caracteres
+
+# runs made of text, tabs and breaks can be rewritten with run.text, python-docx rebuilds the tabs and breaks
+TEXTE_SIMPLE = {qn("w:rPr"), qn("w:t"), qn("w:tab"), qn("w:br"), qn("w:cr")}
+
+# in place mode: write the translation of a run group into the existing xml, formatting is untouched
+def ecrire_groupe_en_place(groupe, traduction):
+    premier = groupe[0]
+    for run in groupe[1:]:
+        run._r.getparent().remove(run._r)  # merged runs become one run
+
+    if all(child.tag in TEXTE_SIMPLE for child in premier._r):
+        premier.text = traduction
+        return
+
+    # run with a field, a picture... : only its w:t nodes are replaced
+    noeuds_texte = premier._r.findall(qn("w:t"))
+    for i, t in enumerate(noeuds_texte):
+        t.text = traduction if i == 0 else ""
+        t.set("{http://www.w3.org/XML/1998/namespace}space", "preserve")
+
+def ecrire_en_place(groupes_par_paragraphe, traductions):
+    for groupes in groupes_par_paragraphe.values():
+        for groupe in groupes:
+            if not texte_groupe(groupe).strip():
+                continue  # nothing was translated, keep the original spaces
+            ecrire_groupe_en_place(groupe, traductions.get(groupe[0]._r, ""))
+
+# footnotes and endnotes are plain parts, their edited xml is written back in the package
+def enregistrer_histoires(histoires):
+    for part, racine in histoires:
+        if not isinstance(part, XmlPart):
+            part._blob = serialize_part_xml(racine)
+
+# put the image of the source document in the translated one through the public python-docx api:
+# the new part reuses the same bytes, and an image already copied (same content) is only linked
+def copier_image(image_part, doc_traduit, images_copiees):
+    sha1 = image_part.sha1
+    if sha1 not in images_copiees:
+        images_copiees[sha1] = doc_traduit.part.get_or_add_image(BytesIO(image_part.blob))[0]
+    return images_copiees[sha1]
+
+# cell properties added to every translated table, parsed once and copied for each cell
+BORDURES_CELLULE = parse_xml(r'''
+    <w:tcBorders xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">
+        <w:top w:val="single" w:sz="4" w:space="0" w:color="000000"/>
+        <w:left w:val="single" w:sz="4" w:space="0" w:color="000000"/>
+        <w:bottom w:val="single" w:sz="4" w:space="0" w:color="000000"/>
+        <w:right w:val="single" w:sz="4" w:space="0" w:color="000000"/>
+    </w:tcBorders>''')
+FOND_EN_TETE = parse_xml(r'''
+    <w:shd xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+        w:val="clear" w:color="auto" w:fill="4F81BD"/>''')
+
+# formatting is copied by cloning the whole w:rPr / w:pPr of the source (spacing, language, rtl, caps,
+# theme colors... included), each distinct property set is cleaned once and kept as a model,
+# every run or paragraph then only gets a copy of its model
+# removed from the models: revision marks, and what points to parts the rebuilt document does not have
+# (section properties with their header references, list numbering); the paragraph style is set by name
+RETIRES_RPR = {qn("w:rPrChange")}
+RETIRES_PPR = {qn("w:pPrChange"), qn("w:sectPr"), qn("w:numPr"), qn("w:pStyle")}
+MODELES_MAX = 10000  # distinct property sets kept, the models are dropped when there are more
+modeles_format = {}
+
+def modele_format(proprietes, retires):
+    cle = etree.tostring(proprietes)
+    modele = modeles_format.get(cle)
+    if modele is None:
+        if len(modeles_format) >= MODELES_MAX:
+            modeles_format.clear()
+        modele = deepcopy(proprietes)
+        for enfant in list(modele):
+            if enfant.tag in retires:
+                modele.remove(enfant)
+        modeles_format[cle] = modele
+    return modele
+
+# copy the formatting of a source run on a new run
+# styles: stage.styles.CorrespondanceStyles of the output, the character style of the run is brought along
+def copier_format_run(run, new_run, styles=None):
+    rPr = run._r.rPr
+    if rPr is None:
+        return
+    ancien = new_run._r.rPr
+    if ancien is not None:
+        new_run._r.remove(ancien)
+    nouveau = deepcopy(modele_format(rPr, RETIRES_RPR))
+    new_run._r.insert(0, nouveau)
+    if styles is not None and nouveau.style is not None:
+        nouveau.style = styles.resoudre(nouveau.style)
+
+# copy the formatting of a source paragraph (spacing, indents, alignment, borders, bidi...) on a new one
+# with styles (stage.styles.CorrespondanceStyles) the source paragraph style is given to the new paragraph,
+# otherwise the style the new paragraph already has is kept
+def copier_format_paragraphe(para, new_para, styles=None):
+    pPr = para._p.pPr
+    if pPr is not None:
+        nouveau = deepcopy(modele_format(pPr, RETIRES_PPR))
+        ancien = new_para._p.pPr
+        if ancien is not None:
+            if ancien.pStyle is not None:
+                nouveau.insert(0, ancien.pStyle)  # w:pStyle is the first child of w:pPr
+            new_para._p.replace(ancien, nouveau)
+        else:
+            new_para._p.insert(0, nouveau)
+    if styles is not None:
+        style_id = styles.resoudre(para._p.style)
+        if style_id is not None:
+            new_para._p.style = style_id
+
+# rebuilt document: headers and footers are written again with their translated runs, like the body
+# (a table or a text box of a header becomes plain paragraphs)
+def copier_entetes(doc, doc_traduit, entetes, groupes_par_paragraphe, traductions, styles):
+    section = doc_traduit.sections[0]
+    section.different_first_page_header_footer = doc.sections[-1].different_first_page_header_footer
+    doc_traduit.settings.odd_and_even_pages_header_footer = doc.settings.odd_and_even_pages_header_footer
+    for nom, entete in entetes:
+        cible = getattr(section, nom)
+        cible.is_linked_to_previous = False
+        racine = cible._element
+        for enfant in list(racine):
+            racine.remove(enfant)  # the empty paragraph of the default header
+
+        for p in entete._element.iter(qn("w:p")):
+            groupes = groupes_par_paragraphe[p]
+            if not any(texte_groupe(groupe).strip() for groupe in groupes):
+                continue
+            new_para = cible.add_paragraph()
+            copier_format_paragraphe(Paragraph(p, entete), new_para, styles)
+            for groupe in groupes:
+                new_run = new_para.add_run(traductions.get(groupe[0]._r, ""))
+                copier_format_run(groupe[0], new_run, styles)
+
+        if racine.find(qn("w:p")) is None:
+            cible.add_paragraph()  # a header must hold at least one paragraph
 
 # main function to translate all docx content
-def traduire_document(doc, use_mock=True):
+# en_place: the text of the loaded document is replaced and the same document is returned,
+#           everything that is not text (sections, numbering, fields...) is kept as it is
+# headers and footers are translated in both modes; footnotes, endnotes and text boxes only in place
+#           (the rebuilt document does not carry them)
+# fusionner_runs: adjacent runs with the same formatting are translated and written as one run
+# mode_paragraphe: paragraphs with mixed formatting are translated in one piece with inline markers
+# blocs: optional stage.revision.MemoireBlocs, sidecar of the previous revision of the document, only
+#        the changed blocks are translated and the sidecar is written again at the end
+# reprise: optional stage.reprise.PointDeReprise, checkpoint of the answered batches to resume a killed job
+# trace: optional stage.trace.Trace, receives the timing of every batch, segment and phase
+# backend, source, cible: translation backend (see stage/backends.py) and language pair
+# the per-item messages go to the "stage.translation" logger at debug level (quiet by default)
+# stats: optional dict, receives the segment counts and stats["phases"], the time in seconds of each phase,
+#        and stats["phases_cpu"], the cpu time of the job (its thread and its batch threads) in the main phases
+# metriques: optional stage.metriques.Metriques of the job, the process registry (METRIQUES) always gets them too
+@instrumenter("document")
+def traduire_document(doc, use_mock=True, taille_lot=50, max_caracteres=5000, cache=None, stats=None,
+                      concurrence=4, fusionner_runs=True, mode_paragraphe=False, en_place=False,
+                      trace=TRACE_INACTIVE, backend=None, source=LANGUE_SOURCE, cible=LANGUE_CIBLE,
+                      termes_proteges=(), blocs=None, reprise=None):
+    debug = logger.isEnabledFor(logging.DEBUG)  # checked once, the messages below are only built when needed
+
+    phases = {"parcours": 0.0, "collecte": 0.0, "traduction": 0.0, "copie_format": 0.0, "copie_images": 0.0,
+              "construction": 0.0}
+    phases_cpu = {}
+    if stats is not None:
+        stats["phases_cpu"] = phases_cpu
+
+    # collect every segment first, then translate them by batches instead of one call per run
+    debut, debut_cpu = time.perf_counter(), horloge_cpu()
+    items = list(iter_block_items_with_images(doc))
+    # text outside the body goes in the same batches and cache as the body
+    if en_place:
+        histoires = histoires_du_document(doc)
+        hors_corps = paragraphes_hors_corps(doc, histoires)
+    else:
+        entetes = entetes_affiches(doc)
+        hors_corps = [Paragraph(p, entete) for _, entete in entetes for p in entete._element.iter(qn("w:p"))]
+    phases["parcours"] = time.perf_counter() - debut
+    debut = time.perf_counter()
+    groupes_par_paragraphe, segments, segments_marques = collecter_segments(items + hors_corps, fusionner_runs,
+                                                                            mode_paragraphe)
+    phases["collecte"] = time.perf_counter() - debut
+    phases_cpu["collecte"] = horloge_cpu() - debut_cpu
+    trace.ecrire("phase", nom="collecte", duree_ms=(phases["parcours"] + phases["collecte"]) * 1000,
+                 blocs=len(items), hors_corps=len(hors_corps), segments=len(segments) + len(segments_marques))
+
+    debut, debut_cpu = time.perf_counter(), horloge_cpu()
+    # emails, urls, numbers, placeholders and the given terms (names, brands...) are never translated
+    protecteur = Protecteur(glossaire=termes_proteges) if termes_proteges else PROTECTEUR_DEFAUT
+    if blocs is not None:
+        contexte = f"{backend or ('mock' if use_mock else 'libretranslate')}|{source}|{cible}"
+        reprises, blocs_reutilises, caracteres_reutilises = reprendre_blocs(groupes_par_paragraphe, blocs, contexte)
+        segments = [(r, texte) for r, texte in segments if r not in reprises]
+        segments_marques = [(cles, texte) for cles, texte in segments_marques if cles[0] not in reprises]
+    stats_lot = {} if stats is None else stats  # the failed segments are needed for the sidecar
+    echecs_avant = len(stats_lot.get("segments_en_echec", []))
+    traductions = traduire_segments(segments, segments_marques, use_mock=use_mock, taille_lot=taille_lot,
+                                    max_caracteres=max_caracteres, cache=cache, stats=stats_lot,
+                                    concurrence=concurrence, trace=trace, backend=backend, source=source, cible=cible,
+                                    protecteur=protecteur, reprise=reprise)
+    if blocs is not None:
+        traductions.update(reprises)
+        echecs = {echec["texte"] for echec in stats_lot.get("segments_en_echec", [])[echecs_avant:]}
+        nb_blocs, caracteres = memoriser_blocs(groupes_par_paragraphe, traductions, blocs, contexte, echecs)
+        blocs.enregistrer()
+        if stats is not None:
+            stats["blocs"] = nb_blocs
+            stats["blocs_reutilises"] = blocs_reutilises
+            stats["caracteres_reutilises"] = caracteres_reutilises
+            stats["taux_reutilisation"] = caracteres_reutilises / caracteres if caracteres else 0.0
+    phases["traduction"] = time.perf_counter() - debut
+    phases_cpu["traduction"] = horloge_cpu() - debut_cpu
+    trace.ecrire("phase", nom="traduction", duree_ms=phases["traduction"] * 1000)
+
+    debut, debut_cpu = time.perf_counter(), horloge_cpu()
+    if en_place:
+        ecrire_en_place(groupes_par_paragraphe, traductions)
+        enregistrer_histoires(histoires)
+        phases["construction"] = time.perf_counter() - debut
+        phases_cpu["construction"] = horloge_cpu() - debut_cpu
+        trace.ecrire("phase", nom="ecriture", duree_ms=phases["construction"] * 1000)
+        if stats is not None:
+            stats["phases"] = phases
+        return doc
+
     doc_traduit = Document()
-    print(f"there is : {len(doc.inline_shapes)} image(s)")
+    styles = CorrespondanceStyles(doc, doc_traduit)  # source styles copied once, when first used
+    if debug:
+        logger.debug("there is : %d image(s)", len(doc.inline_shapes))
+    images_copiees = {}  # sha1 of the image -> rId in the translated document
+    prochain_id = None   # shape ids of the inserted pictures, computed once
 
-    for item in iter_block_items_with_images(doc):
+    for item in items:
         if isinstance(item, Paragraph):
-            style_name = item.style.name
-            try:
-                new_para = doc_traduit.add_paragraph(style=style_name)
-            except KeyError:
-                new_para = doc_traduit.add_paragraph()  # fallback if style not found
-
-            # copy paragraph spacing and alignment
-            new_para.paragraph_format.space_before = item.paragraph_format.space_before
-            new_para.paragraph_format.space_after = item.paragraph_format.space_after
-            new_para.paragraph_format.left_indent = item.paragraph_format.left_indent
-            new_para.paragraph_format.right_indent = item.paragraph_format.right_indent
-            new_para.paragraph_format.first_line_indent = item.paragraph_format.first_line_indent
-            new_para.alignment = item.alignment
+            new_para = doc_traduit.add_paragraph()
+
+            # copy paragraph style, spacing, indents and alignment
+            debut_format = time.perf_counter()
+            copier_format_paragraphe(item, new_para, styles)
+            phases["copie_format"] += time.perf_counter() - debut_format
 
             # if paragraph is fully empty, skip
             if item.text.strip() == "":
                 if all(run.text.strip() == "" for run in item.runs):
-                    print("> empty paragraph skipped (all runs empty)")
+                    logger.debug("> empty paragraph skipped (all runs empty)")
                     continue
                 else:
-                    print("> empty paragraph copied (some runs not empty)")
+                    logger.debug("> empty paragraph copied (some runs not empty)")
 
-            leading_spaces = len(item.text) - len(item.text.lstrip(" "))
-            leading_tabs = len(item.text) - len(item.text.lstrip("\t"))
-            prefix = " " * leading_spaces + "\t" * leading_tabs
-
-            for i, run in enumerate(item.runs):
-                run_text = run.text
-                translated_text = traduire_texte(run_text, use_mock)
-                run_prefix = prefix if i == 0 else ""
-                new_run = new_para.add_run(run_prefix + translated_text)
+            # traduire_lot puts back the edge spaces of each run, a run of spaces only is copied as it is
+            for groupe in groupes_par_paragraphe[item._p]:
+                run = groupe[0]  # every run of the group has the same formatting
+                texte = texte_groupe(groupe)
+                new_run = new_para.add_run(traductions.get(run._r, "") if texte.strip() else texte)
 
                 # copy basic font style
-                new_run.bold = run.bold
-                new_run.italic = run.italic
-                new_run.underline = run.underline
-                new_run.font.name = run.font.name
-                new_run.font.size = run.font.size
-                new_run.font.color.rgb = run.font.color.rgb if run.font.color and run.font.color.rgb else None
-                new_run.font.highlight_color = run.font.highlight_color
-                new_run.font.strike = run.font.strike
+                debut_format = time.perf_counter()
+                copier_format_run(run, new_run, styles)
+                phases["copie_format"] += time.perf_counter() - debut_format
 
         elif isinstance(item, Table):
-            print("\n=== new table found ===")
-            new_table = doc_traduit.add_table(rows=len(item.rows), cols=len(item.columns))
-
-            if item.style:
-                new_table.style = item.style
-                print(f"> table style : {item.style}")
-
-            for i, row in enumerate(item.rows):
+            logger.debug("=== new table found ===")
+            tbl = item._tbl
+            new_table = doc_traduit.add_table(rows=0, cols=len(tbl.tblGrid.gridCol_lst))
+
+            style_table = styles.resoudre(tbl.tblPr.style)
+            if style_table is not None:
+                new_table._tbl.tblPr.style = style_table
+                logger.debug("> table style : %s", style_table)
+
+            # rows and cells are walked on the w:tr / w:tc elements, each source cell gives one
+            # new cell with the same span and vertical merge, so merged tables keep their shape
+            for i, tr in enumerate(tbl.tr_lst):
                 is_header = (i == 0)
-                print(f"--- row {i+1} ---")
-                for j, cell in enumerate(row.cells):
-                    print(f"  > cell ({i+1},{j+1}) : {cell.text.strip()[:50]}")
-                    new_cell = new_table.cell(i, j)
-                    new_cell._tc.clear_content()  # remove default content
-
-                    for para_idx, para in enumerate(cell.paragraphs):
-                        print(f"    - paragraph {para_idx+1} (alignment: {para.alignment})")
+                logger.debug("--- row %d ---", i + 1)
+                new_tr = new_table._tbl.add_tr()
+                for j, tc in enumerate(tr.tc_lst):
+                    cell = _Cell(tc, item)
+                    if debug:
+                        logger.debug("  > cell (%d,%d) : %s", i + 1, j + 1, cell.text.strip()[:50])
+                    new_tc = new_tr.add_tc()
+                    new_tc.clear_content()  # remove default content
+                    if tc.width is not None:
+                        new_tc.width = tc.width
+                    if tc.grid_span > 1:
+                        new_tc.grid_span = tc.grid_span
+                    if tc.vMerge is not None:
+                        new_tc.vMerge = tc.vMerge
+                    new_cell = _Cell(new_tc, new_table)
+
+                    for para_idx, p in enumerate(tc.p_lst):
+                        para = Paragraph(p, cell)
+                        if debug:
+                            logger.debug("    - paragraph %d (alignment: %s)", para_idx + 1, para.alignment)
                         new_para = new_cell.add_paragraph()
-                        new_para.paragraph_format.space_before = para.paragraph_format.space_before
-                        new_para.paragraph_format.space_after = para.paragraph_format.space_after
-                        new_para.alignment = para.alignment
-
-                        for run_idx, run in enumerate(para.runs):
-                            run_text = run.text
-                            translated = traduire_texte(run_text, use_mock)
-                            print(f"      • run {run_idx+1}: '{run_text}' ⟶ '{translated}'")
+                        debut_format = time.perf_counter()
+                        copier_format_paragraphe(para, new_para, styles)
+                        phases["copie_format"] += time.perf_counter() - debut_format
+
+                        for run_idx, groupe in enumerate(groupes_par_paragraphe[p]):
+                            run = groupe[0]
+                            translated = traductions.get(run._r, "")
+                            if debug:
+                                logger.debug("      • run %d: '%s' ⟶ '%s'", run_idx + 1, texte_groupe(groupe), translated)
                             new_run = new_para.add_run(translated)
 
                             # copy run formatting
-                            new_run.bold = run.bold
-                            new_run.italic = run.italic
-                            new_run.underline = run.underline
-                            new_run.font.name = run.font.name
-                            new_run.font.size = run.font.size
-                            if run.font.color and run.font.color.rgb:
-                                new_run.font.color.rgb = run.font.color.rgb
-                            new_run.font.highlight_color = run.font.highlight_color
-                            new_run.font.strike = run.font.strike
-
-                    # if header row, add blue background
+                            debut_format = time.perf_counter()
+                            copier_format_run(run, new_run, styles)
+                            phases["copie_format"] += time.perf_counter() - debut_format
+
+                    if not new_tc.p_lst:
+                        new_tc.add_p()  # a cell must hold at least one paragraph
+
+                    # add border to all cells, and a blue background to the header row
+                    # (fragments parsed once, only copied here)
+                    tcPr = new_tc.get_or_add_tcPr()
+                    tcPr.append(deepcopy(BORDURES_CELLULE))
                     if is_header:
-                        shading = parse_xml(r'''
-                            <w:shd xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"
-                                w:val="clear" w:color="auto" w:fill="4F81BD"/>
-                        ''')
-                        tcPr = new_cell._tc.get_or_add_tcPr()
-                        tcPr.append(shading)
-
-                    # add border to all cells
-                    tc = new_cell._tc
-                    tcPr = tc.get_or_add_tcPr()
-                    borders = parse_xml(r'''
-                        <w:tcBorders xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">
-                            <w:top w:val="single" w:sz="4" w:space="0" w:color="000000"/>
-                            <w:left w:val="single" w:sz="4" w:space="0" w:color="000000"/>
-                            <w:bottom w:val="single" w:sz="4" w:space="0" w:color="000000"/>
-                            <w:right w:val="single" w:sz="4" w:space="0" w:color="000000"/>
-                        </w:tcBorders>''')
-                    tcPr.append(borders)
+                        tcPr.append(deepcopy(FOND_EN_TETE))
 
         elif isinstance(item, InlineShape):
-            # extract image stream from the document
-            rId = item._inline.graphic.graphicData.pic.blipFill.blip.embed
-            image_part = doc.part.related_parts[rId]
-            image_bytes = image_part.blob
-            image_stream = BytesIO(image_bytes)
+            debut_image = time.perf_counter()
+            pic = item._inline.graphic.graphicData.pic
+            if pic is None:
+                logger.debug("  inline shape without picture skipped (chart, smartart...)")
+                continue
+            image_part = doc.part.related_parts[pic.blipFill.blip.embed]
 
             # add a new paragraph for the image
             para = doc_traduit.add_paragraph()
@@ -199,16 +571,29 @@ def traduire_document(doc, use_mock=True):
 
                 if align_str in align_map:
                     para.alignment = align_map[align_str]
-                    print(f"  inherited alignment : {align_str}")
+                    logger.debug("  inherited alignment : %s", align_str)
                 else:
-                    print("  alignment not found or not valid")
+                    logger.debug("  alignment not found or not valid")
 
             except Exception as e:
-                print(f"  failed to get alignment : {e}")
-
-            # insert the image with original width
-            run = para.add_run()
-            run.add_picture(image_stream, width=item.width)
-            print("  image inserted")
-
+                logger.debug("  failed to get alignment : %s", e)
+
+            # insert the image with its original size, the image part is shared and never decoded again
+            rId_image = copier_image(image_part, doc_traduit, images_copiees)
+            if prochain_id is None:
+                prochain_id = doc_traduit.part.next_id
+            inline = CT_Inline.new_pic_inline(prochain_id, rId_image, image_part.filename, item.width, item.height)
+            prochain_id += 1
+            para.add_run()._r.add_drawing(inline)
+            phases["copie_images"] += time.perf_counter() - debut_image
+            logger.debug("  image inserted")
+
+    copier_entetes(doc, doc_traduit, entetes, groupes_par_paragraphe, traductions, styles)
+
+    # construction is the time of the rebuild without the formatting and image copies
+    phases["construction"] = time.perf_counter() - debut - phases["copie_format"] - phases["copie_images"]
+    phases_cpu["construction"] = horloge_cpu() - debut_cpu  # formatting and image copies included
+    trace.ecrire("phase", nom="construction", duree_ms=(time.perf_counter() - debut) * 1000)
+    if stats is not None:
+        stats["phases"] = phases
     return doc_traduit
\ No newline at end of file
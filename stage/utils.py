@@ -1,43 +1,333 @@
+import html
+import logging
+import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from tenacity import retry, stop_after_attempt, wait_fixed
+from requests.adapters import HTTPAdapter
+from tenacity import retry, retry_if_exception
+
+from stage.trace import TRACE_INACTIVE
+from stage.segmentation import decouper_phrases
+from stage.protection import (PROTECTEUR_DEFAUT, Protecteur, entierement_protege, inverser_en_gardant_jetons,
+                              jetons_intacts)
+from stage import resilience
+from stage import metriques
 
 # utils.py for all of the functions which are usefull
 
+logger = logging.getLogger(__name__)
+
+LANGUE_SOURCE = "en"
+LANGUE_CIBLE = "ar"
+
+# translation endpoint, LIBRETRANSLATE_URL can point to another server (for example stage/serveur_local.py)
+URL_API = os.environ.get("LIBRETRANSLATE_URL", "https://libretranslate.de/translate")
+TIMEOUT_API = float(os.environ.get("LIBRETRANSLATE_TIMEOUT", "10"))
+
+CONCURRENCE_MAX = 16  # size of the connection pool, upper bound for the concurrency setting
+
+# one keep-alive session shared by every call (and every thread) instead of a new connection per call
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=CONCURRENCE_MAX))
+session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=CONCURRENCE_MAX))
+
 def en_majuscule(texte):
     return texte.upper()
 
 
 
 
+# fake translation: reversed text, protected spans (emails, urls, numbers...) stay readable
 def mock_reverse(text):
-    emails = re.findall(r'\S+@\S+\.\S+', text)
-    placeholders = [f"__EMAIL{i}__" for i in range(len(emails))]
-    for email, placeholder in zip(emails, placeholders):
-        text = text.replace(email, placeholder)
-    reversed_text = text[::-1]
-    for placeholder, email in zip(placeholders, emails):
-        reversed_text = reversed_text.replace(placeholder[::-1], email)
-    return reversed_text
-
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
-def appel_api_libretranslate(texte):
-    response = requests.post(
-        "https://libretranslate.de/translate",
-        data={"q": texte, "source": "en", "target": "ar", "format": "text"},
-        timeout=10
+    masque, valeurs = PROTECTEUR_DEFAUT.masquer(text)
+    return Protecteur.restaurer(inverser_en_gardant_jetons(masque), valeurs)
+
+# mock for html segments: only the text between the tags is reversed, tags stay in place
+def mock_reverse_html(text):
+    morceaux = re.split(r'(<[^>]+>)', text)
+    return "".join(
+        m if m.startswith("<") else html.escape(mock_reverse(html.unescape(m)), quote=False)
+        for m in morceaux
     )
-    response.raise_for_status()
-    return response.json()["translatedText"]
 
-def traduire_texte(texte, use_mock=True):
-    if not texte.strip():
-        return ""
-    if use_mock:
-        return mock_reverse(texte)
+# one post to the api, through the circuit breaker and the rate limiter shared by all the threads
+# every attempt is counted by status and its latency recorded (time waiting for the rate limiter excluded)
+def poster(**corps):
     try:
-        return appel_api_libretranslate(texte)
+        resilience.disjoncteur.verifier()
+    except resilience.CircuitOuvert:
+        metriques.compter("appels_api_total", statut="circuit_ouvert")
+        raise
+    resilience.limiteur.prendre()
+    debut = time.perf_counter()
+    try:
+        response = session.post(URL_API, timeout=TIMEOUT_API, **corps)
+        response.raise_for_status()
     except Exception as e:
-        print("Translation error after retries:", e)
-        return texte
+        reponse = getattr(e, "response", None)
+        metriques.compter("appels_api_total", statut=str(reponse.status_code) if reponse is not None else "erreur")
+        metriques.observer("duree_appel_api_secondes", time.perf_counter() - debut)
+        if resilience.erreur_panne(e):
+            resilience.disjoncteur.echec()
+        else:
+            resilience.disjoncteur.succes()  # the server answered, it is not down
+        raise
+    metriques.compter("appels_api_total", statut=str(response.status_code))
+    metriques.observer("duree_appel_api_secondes", time.perf_counter() - debut)
+    resilience.disjoncteur.succes()
+    return response.json()["translatedText"]
+
+# only network errors, timeouts, 429 and 5xx are retried, with exponential backoff (see stage/resilience.py)
+reessayer = retry(
+    retry=retry_if_exception(resilience.erreur_reessayable),
+    wait=resilience.attente_adaptative,
+    stop=resilience.arret_adaptatif,
+    before_sleep=resilience.avant_nouvel_essai,
+    reraise=True,
+)
+
+@reessayer
+def appel_api_libretranslate(texte):
+    return poster(data={"q": texte, "source": LANGUE_SOURCE, "target": LANGUE_CIBLE, "format": "text"})
+
+# same call but with a list of texts, libretranslate answers with a list in the same order
+# format="html" keeps the tags of the texts untouched
+@reessayer
+def appel_api_libretranslate_lot(textes, format="text", source=LANGUE_SOURCE, cible=LANGUE_CIBLE):
+    return poster(json={"q": textes, "source": source, "target": cible, "format": format})
+
+# one text, a long one is cut at sentence ends like in traduire_lot (the source is kept on error)
+def traduire_texte(texte, use_mock=True):
+    return traduire_lot([texte], use_mock=use_mock)[0]
+
+# split the texts in groups of indexes, a group never has more than taille_lot texts
+# or more than max_caracteres characters (a single text longer than the limit goes alone)
+# mesure: size of a text, len for a character budget, segmentation.estimer_jetons for a token budget
+# max_longueur: characters per batch whatever the measure (limit of the server), None = no other limit
+def decouper_en_lots(textes, taille_lot=50, max_caracteres=5000, mesure=len, max_longueur=None):
+    lot = []
+    taille = 0
+    caracteres = 0
+    for i, texte in enumerate(textes):
+        longueur = mesure(texte)
+        if lot and (len(lot) >= taille_lot or taille + longueur > max_caracteres
+                    or (max_longueur is not None and caracteres + len(texte) > max_longueur)):
+            yield lot
+            lot = []
+            taille = 0
+            caracteres = 0
+        lot.append(i)
+        taille += longueur
+        caracteres += len(texte)
+    if lot:
+        yield lot
+
+# key of a segment, used to find repeated segments: the text without its edge spaces (put back on each
+# occurrence by remettre_espaces), the spaces, tabs and line breaks inside it are part of the text
+def normaliser(texte):
+    return texte.strip()
+
+# put back the leading and trailing spaces of the source around its translation
+def remettre_espaces(source, traduction):
+    debut = source[:len(source) - len(source.lstrip())]
+    fin = source[len(source.rstrip()):]
+    return debut + traduction + fin
+
+# translate a list of texts with one api call per batch, results keep the same order
+# identical segments (edge spaces aside) are translated only once and copied back everywhere
+# if a translation memory is given, it is checked before any api call and filled after
+# if a stats dict is given, it receives the segment counts of the job
+# up to `concurrence` batches are in flight at the same time
+# with an active trace, every batch and every unique segment is recorded with its timing
+# backend: name (or object) from stage.backends, by default "mock" or "libretranslate" following use_mock;
+# batch size, characters per batch and concurrency never go above the limits the backend declares
+# protecteur: stage.protection.Protecteur masking emails, urls, numbers... before sending (None = off)
+# reprise: optional stage.reprise.PointDeReprise, every answered batch is recorded at once and the
+#          texts already recorded by an earlier (killed) run of the job are not sent again
+# max_segment: longest piece sent (default and limit: the request budget), longer texts are cut at sentence ends
+# mesure: how max_caracteres and max_segment are counted, len (characters) or segmentation.estimer_jetons
+def traduire_lot(textes, use_mock=True, taille_lot=50, max_caracteres=5000, cache=None, stats=None,
+                 concurrence=4, format="text", trace=TRACE_INACTIVE, backend=None,
+                 source=LANGUE_SOURCE, cible=LANGUE_CIBLE, protecteur=PROTECTEUR_DEFAUT, reprise=None,
+                 max_segment=None, mesure=len):
+    from stage.backends import obtenir_backend  # the backends module imports this one
+
+    if backend is None:
+        backend = "mock" if use_mock else "libretranslate"
+    moteur = obtenir_backend(backend) if isinstance(backend, str) else backend
+    if not moteur.accepte(source, cible):
+        raise ValueError(f"backend {moteur.nom} does not translate {source} -> {cible}")
+    taille_lot = min(taille_lot, moteur.max_lot)
+    max_caracteres = min(max_caracteres, moteur.max_caracteres)
+    concurrence = min(concurrence, moteur.concurrence)
+
+    resultats = [""] * len(textes)
+    backend = moteur.nom
+    if format != "text":
+        backend += ":" + format  # html and text translations of the same string are not the same
+    if protecteur is None:
+        backend += ":brut"
+    elif protecteur.signature != PROTECTEUR_DEFAUT.signature:
+        backend += ":" + protecteur.signature  # nor are the translations masked with another glossary
+
+    occurrences = {}  # normalized text -> indexes of every place it appears
+    for i, texte in enumerate(textes):
+        if texte.strip():  # empty texts are never sent
+            occurrences.setdefault(normaliser(texte), []).append(i)
+
+    traductions_uniques = {}
+    a_traduire = []
+    for unique in occurrences:
+        traduction = cache.get(unique, source, cible, backend) if cache is not None else None
+        if traduction is None:
+            a_traduire.append(unique)
+            if cache is not None:
+                metriques.compter("cache_misses_total")
+        else:
+            traductions_uniques[unique] = traduction
+            metriques.compter("cache_hits_total")
+            if trace.actif:
+                trace.ecrire("segment", caracteres=len(unique), occurrences=len(occurrences[unique]),
+                             source="cache", duree_ms=0.0)
+
+    # protected spans are masked, a text left with nothing to translate is never sent,
+    # and texts that only differ by their protected values ("Page 1", "Page 2") are sent once
+    masques = {}  # masked text -> [(unique text, protected values), ...]
+    proteges = 0
+    for unique in a_traduire:
+        if protecteur is None:
+            masques.setdefault(unique, []).append((unique, {}))
+            continue
+        masque, valeurs = protecteur.masquer(unique, html=format == "html")
+        if entierement_protege(masque):
+            traductions_uniques[unique] = unique
+            proteges += 1
+        else:
+            masques.setdefault(masque, []).append((unique, valeurs))
+    a_envoyer = list(masques)
+
+    echecs = []  # segments left untranslated, they are reported to the caller
+
+    def retenir(masque, traduction):
+        for unique, valeurs in masques[masque]:
+            if not jetons_intacts(traduction, valeurs):
+                # a protected value lost by the backend: the source text is kept, not cached, and reported
+                echecs.append({"texte": unique, "erreur": "protected spans not returned by the backend"})
+                continue
+            traductions_uniques[unique] = Protecteur.restaurer(traduction, valeurs)
+            if cache is not None:
+                cache.set(unique, traductions_uniques[unique], source, cible, backend)
+
+    # a text over the request budget is cut at sentence ends (plain text only, html tags must stay whole),
+    # every distinct piece is sent once and the text is put back together from its translated pieces
+    max_segment = max_caracteres if max_segment is None else min(max_segment, max_caracteres)
+    pieces_de = {}  # masked text -> its pieces, "".join(pieces) == masked text
+    occurrences_pieces = {}  # normalized piece -> places it appears in the document
+    for masque in a_envoyer:
+        pieces = decouper_phrases(masque, max_segment, mesure) if format == "text" else [masque]
+        if mesure is not len and format == "text":
+            # a token budget is not a character one: the characters the backend accepts are checked too
+            pieces = [morceau for piece in pieces for morceau in decouper_phrases(piece, moteur.max_caracteres)]
+        pieces_de[masque] = pieces
+        places = sum(len(occurrences[unique]) for unique, _ in masques[masque])
+        for piece in pieces:
+            if piece.strip():
+                occurrences_pieces[normaliser(piece)] = occurrences_pieces.get(normaliser(piece), 0) + places
+    a_envoyer = list(occurrences_pieces)
+
+    traductions_pieces = {}  # normalized piece -> translation
+    repris = 0
+    if reprise is not None:
+        restants = []
+        for piece in a_envoyer:
+            traduction = reprise.get(piece, source, cible, backend)
+            if traduction is None:
+                restants.append(piece)
+            else:
+                traductions_pieces[piece] = traduction
+                repris += 1
+        a_envoyer = restants
+
+    lots = [[a_envoyer[k] for k in lot]
+            for lot in decouper_en_lots(a_envoyer, taille_lot, max_caracteres, mesure, moteur.max_caracteres)]
+
+    def traduire_morceaux(morceaux):
+        metriques.compter("lots_total", backend=moteur.nom)
+        metriques.observer("taille_lot_segments", len(morceaux))
+        metriques.observer("taille_lot_caracteres", sum(len(m) for m in morceaux))
+        debut = time.perf_counter()
+        try:
+            traductions = moteur.traduire(morceaux, format, source, cible)
+        except Exception as e:
+            metriques.compter("lots_en_echec_total", backend=moteur.nom)
+            metriques.observer("duree_lot_secondes", time.perf_counter() - debut, backend=moteur.nom)
+            return None, time.perf_counter() - debut, e
+        metriques.observer("duree_lot_secondes", time.perf_counter() - debut, backend=moteur.nom)
+        if reprise is not None:
+            reprise.ajouter_lot(morceaux, traductions, source, cible, backend)  # as soon as it is paid for
+        return traductions, time.perf_counter() - debut, None
+
+    # local backends (mock, dictionary) declare concurrence=1, threads would only add overhead
+    if concurrence <= 1 or len(lots) <= 1:
+        resultats_lots = list(map(traduire_morceaux, lots))
+    else:
+        with ThreadPoolExecutor(max_workers=min(concurrence, CONCURRENCE_MAX, len(lots))) as pool:
+            # map gives the results back in batch order, the job metrics and cpu time follow the batches
+            resultats_lots = list(pool.map(metriques.pour_le_travail(traduire_morceaux), lots))
+
+    erreurs_pieces = {}
+    for numero, (morceaux, (traductions, duree, erreur)) in enumerate(zip(lots, resultats_lots)):
+        logger.debug("batch %d: %d segment(s) translated in %.1f ms", numero, len(morceaux), duree * 1000)
+        if trace.actif:
+            caracteres_lot = sum(len(m) for m in morceaux)
+            trace.ecrire("lot", lot=numero, backend=backend, segments=len(morceaux),
+                         caracteres=caracteres_lot, duree_ms=duree * 1000, ok=traductions is not None)
+            for piece in morceaux:
+                # the batch time is shared between its segments by their length
+                trace.ecrire("segment", lot=numero, caracteres=len(piece), occurrences=occurrences_pieces[piece],
+                             source="api", duree_ms=duree * 1000 * len(piece) / max(1, caracteres_lot))
+        if traductions is None:
+            logger.warning("batch %d: %d segment(s) not translated: %s", numero, len(morceaux), erreur)
+            erreurs_pieces.update(dict.fromkeys(morceaux, erreur))
+            continue
+        traductions_pieces.update(zip(morceaux, traductions))
+
+    for masque, pieces in pieces_de.items():
+        if all(normaliser(piece) in traductions_pieces for piece in pieces if piece.strip()):
+            retenir(masque, "".join(remettre_espaces(piece, traductions_pieces[normaliser(piece)]) if piece.strip()
+                                    else piece for piece in pieces))
+        else:
+            # the source text is kept in the document, not cached, and reported
+            erreur = next(erreurs_pieces.get(normaliser(piece)) for piece in pieces
+                          if piece.strip() and normaliser(piece) not in traductions_pieces)
+            echecs.extend({"texte": unique, "erreur": repr(erreur)} for unique, _ in masques[masque])
+
+    # fan the translations out to every occurrence
+    for unique, indices in occurrences.items():
+        for i in indices:
+            if unique in traductions_uniques:
+                resultats[i] = remettre_espaces(textes[i], traductions_uniques[unique])
+            else:
+                resultats[i] = textes[i]
 
+    if cache is not None:
+        cache.flush()
+    nb_segments = sum(len(indices) for indices in occurrences.values())
+    metriques.compter("segments_total", nb_segments)
+    metriques.compter("caracteres_total", sum(len(textes[i]) for ind in occurrences.values() for i in ind))
+    metriques.compter("caracteres_envoyes_total", sum(len(t) for t in a_envoyer))
+    metriques.compter("segments_repris_total", repris)
+    metriques.compter("segments_en_echec_total", len(echecs))
+    if stats is not None:
+        stats["segments"] = stats.get("segments", 0) + nb_segments
+        stats["segments_uniques"] = stats.get("segments_uniques", 0) + len(occurrences)
+        stats["caracteres"] = stats.get("caracteres", 0) + sum(len(textes[i]) for ind in occurrences.values() for i in ind)
+        stats["caracteres_envoyes"] = stats.get("caracteres_envoyes", 0) + sum(len(t) for t in a_envoyer)
+        stats["requetes"] = stats.get("requetes", 0) + len(lots)
+        stats["segments_proteges"] = stats.get("segments_proteges", 0) + proteges
+        stats["segments_repris"] = stats.get("segments_repris", 0) + repris
+        stats["appels_evites_doublons"] = stats.get("appels_evites_doublons", 0) + nb_segments - len(occurrences)
+        stats["segments_en_echec"] = stats.get("segments_en_echec", []) + echecs
+    return resultats
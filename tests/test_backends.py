@@ -0,0 +1,49 @@
+import pytest
+
+from stage.backends import Backend, DictionnaireBackend, obtenir_backend
+from stage.utils import traduire_lot
+from stage.translation import traduire_document
+from docx import Document
+
+
+def test_registry_has_default_backends():
+    assert obtenir_backend("mock").nom == "mock"
+    assert obtenir_backend("libretranslate").max_lot > 0
+    with pytest.raises(ValueError):
+        obtenir_backend("unknown")
+
+
+def test_dictionary_backend_replaces_terms_in_one_pass():
+    backend = DictionnaireBackend("test", {"merci": "thank you", "bonjour": "hello", "bonjour et": "hello and"})
+    assert backend.traduire(["Bonjour et merci pour votre lecture"]) == ["Hello and thank you pour votre lecture"]
+
+
+def test_document_with_dictionary_backend():
+    doc = Document()
+    doc.add_paragraph("Bonjour et bienvenue")
+    translated = traduire_document(doc, backend="dictionnaire-fr-en", source="fr", cible="en")
+    assert translated.paragraphs[0].text == "Hello and welcome"
+
+
+def test_language_pair_is_checked():
+    with pytest.raises(ValueError):
+        traduire_lot(["Bonjour"], backend="dictionnaire-fr-en", source="en", cible="ar")
+
+
+def test_engine_respects_backend_limits():
+    class PetitBackend(Backend):
+        nom = "petit"
+        max_lot = 2
+        max_caracteres = 10
+
+        def __init__(self):
+            self.lots = []
+
+        def traduire(self, textes, format="text", source="en", cible="ar"):
+            self.lots.append(list(textes))
+            return [t.upper() for t in textes]
+
+    backend = PetitBackend()
+    resultats = traduire_lot(["aaaa", "bbbb", "cccc", "dddddddd"], backend=backend, taille_lot=50)
+    assert resultats == ["AAAA", "BBBB", "CCCC", "DDDDDDDD"]
+    assert backend.lots == [["aaaa", "bbbb"], ["cccc"], ["dddddddd"]]
@@ -0,0 +1,60 @@
+from stage.cache import MemoireTraduction
+from stage.utils import traduire_lot
+
+
+def test_cache_hit_and_miss():
+    cache = MemoireTraduction()
+    assert cache.get("Hello", "en", "ar", "mock") is None
+    cache.set("Hello", "olleH", "en", "ar", "mock")
+    assert cache.get("Hello", "en", "ar", "mock") == "olleH"
+    assert cache.get("Hello", "en", "fr", "mock") is None          # other language pair
+    assert cache.get("Hello", "en", "ar", "libretranslate") is None   # other backend
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 3
+
+
+def test_cache_persistent_on_disk(tmp_path):
+    chemin = str(tmp_path / "memoire.sqlite")
+    cache = MemoireTraduction(chemin)
+    cache.set("Signature:", ":erutangiS", "en", "ar", "mock")
+    cache.close()
+
+    cache = MemoireTraduction(chemin)          # new process, empty LRU
+    assert cache.get("Signature:", "en", "ar", "mock") == ":erutangiS"
+
+
+def test_cache_lru_and_disk_limits():
+    cache = MemoireTraduction(taille_lru=2, max_entrees=3)
+    for i in range(5):
+        cache.set(f"texte {i}", f"{i}", "en", "ar", "mock")
+    cache.flush()
+    assert cache.stats()["en_memoire"] == 2
+    assert len(cache) == 3
+
+
+def test_memory_hits_keep_entries_on_disk():
+    import time
+    cache = MemoireTraduction(max_entrees=2)
+    cache.set("a", "A", "en", "ar", "mock")
+    time.sleep(0.01)
+    cache.set("b", "B", "en", "ar", "mock")
+    time.sleep(0.01)
+    assert cache.get("a", "en", "ar", "mock") == "A"  # hit in memory, "a" is now the most recent
+    time.sleep(0.01)
+    cache.set("c", "C", "en", "ar", "mock")
+    cache.flush()
+    restantes = {ligne[0] for ligne in cache._db.execute("SELECT traduction FROM traductions")}
+    assert restantes == {"A", "C"}  # the least recently used one is evicted
+
+
+def test_traduire_lot_checks_cache_before_api(monkeypatch):
+    appels = []
+    def faux_appel(textes, *args):
+        appels.append(list(textes))
+        return [t.upper() for t in textes]
+    monkeypatch.setattr("stage.utils.appel_api_libretranslate_lot", faux_appel)
+
+    cache = MemoireTraduction()
+    traduire_lot(["a", "b"], use_mock=False, cache=cache)
+    assert traduire_lot(["b", "c"], use_mock=False, cache=cache) == ["B", "C"]
+    assert appels == [["a", "b"], ["c"]]     # "b" came from the memory
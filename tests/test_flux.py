@@ -0,0 +1,60 @@
+import zipfile
+
+from docx import Document
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+
+from stage.flux import traduire_fichier_en_flux
+from stage.translation import traduire_document
+
+
+def creer_document(chemin):
+    doc = Document()
+    for i in range(7):
+        doc.add_paragraph(f"Paragraph {i} to translate")
+    table = doc.add_table(rows=2, cols=2)
+    table.cell(1, 1).text = "In a cell"
+    doc.add_paragraph("After the table")
+    doc.sections[0].header.paragraphs[0].text = "The header"
+    doc.save(chemin)
+
+
+def test_streaming_gives_the_in_place_result(tmp_path):
+    entree = tmp_path / "entree.docx"
+    creer_document(entree)
+    stats = traduire_fichier_en_flux(entree, tmp_path / "sortie.docx", fenetre=3)  # several windows
+    en_flux = Document(tmp_path / "sortie.docx")
+    en_place = traduire_document(Document(entree), en_place=True)
+
+    assert [p.text for p in en_flux.paragraphs] == [p.text for p in en_place.paragraphs]
+    assert en_flux.paragraphs[0].text == "etalsnart ot 0 hpargaraP"
+    assert en_flux.tables[0].cell(1, 1).text == "llec a nI"
+    assert en_flux.sections[0].header.paragraphs[0].text == "redaeh ehT"
+    assert stats["segments"] == 10
+
+
+def test_other_children_of_the_root_are_kept(tmp_path):
+    doc = Document()
+    doc.add_paragraph("Hello")
+    fond = parse_xml(f'<w:background {nsdecls("w")} w:color="FF0000"/>')
+    doc.element.insert(0, fond)
+    doc.save(tmp_path / "entree.docx")
+
+    traduire_fichier_en_flux(tmp_path / "entree.docx", tmp_path / "sortie.docx")
+    en_flux = Document(tmp_path / "sortie.docx")
+    assert en_flux.element[0].tag == qn("w:background") and en_flux.element[0].get(qn("w:color")) == "FF0000"
+    assert en_flux.paragraphs[0].text == "olleH"
+
+
+def test_streamed_xml_declares_the_namespaces_once(tmp_path):
+    entree = tmp_path / "entree.docx"
+    creer_document(entree)
+    traduire_fichier_en_flux(entree, tmp_path / "sortie.docx", fenetre=3)
+    traduire_document(Document(entree), en_place=True).save(tmp_path / "en_place.docx")
+
+    with zipfile.ZipFile(tmp_path / "sortie.docx") as z:
+        en_flux = z.read("word/document.xml")
+    with zipfile.ZipFile(tmp_path / "en_place.docx") as z:
+        en_place = z.read("word/document.xml")
+    assert en_flux.count(b"xmlns:w=") == 1
+    assert len(en_flux) <= 1.05 * len(en_place)
@@ -0,0 +1,134 @@
+import json
+
+from docx import Document
+
+from stage import resilience
+from stage.metriques import Metriques, METRIQUES, activer, compter, profiler
+from stage.resilience import Disjoncteur, SeauJetons
+from stage.serveur_local import demarrer_serveur
+from stage.translation import traduire_document
+from stage.utils import traduire_lot
+
+
+def valeur(registre, nom, **etiquettes):
+    return registre.compteurs.get((nom, tuple(sorted(etiquettes.items()))), 0)
+
+
+def test_histogram_buckets_are_cumulative():
+    registre = Metriques()
+    for duree in (0.002, 0.02, 3.0):
+        registre.observer("duree_lot_secondes", duree, backend="mock")
+    h = registre.exporter_json()["histogrammes"][0]
+    assert h["seaux"][h["bornes"].index(0.005)] == 1 and h["seaux"][h["bornes"].index(0.025)] == 2
+    assert h["nombre"] == 3 and h["seaux"][-1] == 3
+
+
+def test_prometheus_export():
+    registre = Metriques()
+    registre.compter("appels_api_total", 2, statut="200")
+    registre.observer("taille_lot_segments", 3)
+    texte = registre.exporter_prometheus()
+    assert '# TYPE traduction_appels_api_total counter' in texte
+    assert 'traduction_appels_api_total{statut="200"} 2' in texte
+    assert 'traduction_taille_lot_segments_bucket{le="5"} 1' in texte
+    assert 'traduction_taille_lot_segments_bucket{le="+Inf"} 1' in texte
+    assert 'traduction_taille_lot_segments_count 1' in texte
+
+
+def test_merge_of_a_worker_export():
+    worker, total = Metriques(), Metriques()
+    worker.compter("segments_total", 4)
+    worker.observer("taille_lot_segments", 4)
+    total.fusionner(json.loads(json.dumps(worker.exporter_json())))
+    total.fusionner(worker.exporter_json())
+    assert valeur(total, "segments_total") == 8
+    assert total.exporter_json()["histogrammes"][0]["nombre"] == 2
+
+
+def test_document_job_metrics():
+    doc = Document()
+    for texte in ["Hello", "World", "Hello"]:
+        doc.add_paragraph(texte)
+    registre, stats = Metriques(), {}
+    traduire_document(doc, use_mock=True, taille_lot=1, stats=stats, metriques=registre)
+
+    assert valeur(registre, "segments_total") == 3
+    assert valeur(registre, "lots_total", backend="mock") == 2  # "Hello" sent once
+    assert valeur(registre, "travaux_total", type="document", ok="true") == 1
+    assert valeur(registre, "phase_secondes_total", phase="traduction") == stats["phases"]["traduction"]
+    assert set(stats["phases_cpu"]) == {"collecte", "traduction", "construction"}
+    assert valeur(METRIQUES, "segments_total") >= 3  # the process registry gets them too
+
+
+def test_batch_threads_record_in_the_job_registry(monkeypatch):
+    monkeypatch.setattr("stage.utils.appel_api_libretranslate_lot", lambda textes, *args: [t.upper() for t in textes])
+    registre = Metriques()
+    with activer(registre):
+        traduire_lot([f"text {c}" for c in "abcdefgh"], use_mock=False, taille_lot=1, concurrence=4)
+        compter("autre")
+    assert valeur(registre, "lots_total", backend="libretranslate") == 8
+    assert valeur(registre, "autre") == 1
+
+
+def test_api_calls_and_retries_are_counted(monkeypatch):
+    monkeypatch.setattr(resilience, "ATTENTE_INITIALE", 0.01)
+    monkeypatch.setattr(resilience, "disjoncteur", Disjoncteur(seuil=3, delai=60))
+    monkeypatch.setattr(resilience, "limiteur", SeauJetons())
+    serveur = demarrer_serveur(taux_429=0.5, retry_after=0, graine=1)
+    monkeypatch.setattr("stage.utils.URL_API", serveur.url)
+    registre = Metriques()
+    try:
+        with activer(registre):
+            traduire_lot(["Hello", "World", "Again"], use_mock=False, taille_lot=1, concurrence=1)
+    finally:
+        serveur.shutdown()
+        serveur.server_close()
+    assert valeur(registre, "appels_api_total", statut="200") == 3
+    assert valeur(registre, "appels_api_total", statut="429") == serveur.compteurs["429"]
+    assert valeur(registre, "nouvelles_tentatives_total") == serveur.compteurs["429"]
+    latences = [h for h in registre.exporter_json()["histogrammes"] if h["nom"] == "duree_appel_api_secondes"]
+    assert latences[0]["nombre"] == 3 + serveur.compteurs["429"]
+
+
+def test_profiler_writes_profile_and_summary(tmp_path):
+    chemin = str(tmp_path / "profil")
+    with profiler(chemin) as resultat:
+        traduire_document(Document(), use_mock=True)
+    assert (tmp_path / "profil.prof").exists()
+    assert "traduire_document" in (tmp_path / "profil.txt").read_text()
+    assert resultat["memoire_max"] > 0
+    with profiler(None) as resultat:  # off: nothing is started or written
+        pass
+    assert resultat == {}
+
+
+def test_positional_stats_still_accepted():
+    doc = Document()
+    doc.add_paragraph("Hello")
+    stats = {}
+    traduire_document(doc, True, 50, 5000, None, stats)
+    assert stats["segments"] == 1 and "phases_cpu" in stats
+
+
+def test_job_cpu_time_excludes_other_threads():
+    import threading
+    import time
+
+    arret = threading.Event()
+    def occuper():  # another job of the service, burning cpu at the same time
+        while not arret.is_set():
+            sum(range(10000))
+    doc = Document()
+    for i in range(300):
+        doc.add_paragraph(f"Paragraph {i} to translate")
+    registre = Metriques()
+    autre = threading.Thread(target=occuper)
+    autre.start()
+    try:
+        debut_processus = time.process_time()
+        traduire_document(doc, use_mock=True, metriques=registre)
+        cpu_processus = time.process_time() - debut_processus
+    finally:
+        arret.set()
+        autre.join()
+    assert valeur(registre, "cpu_travail_secondes_total", type="document") < 0.8 * cpu_processus
@@ -0,0 +1,82 @@
+from docx import Document
+
+from stage.cache import MemoireTraduction
+from stage.protection import Protecteur, entierement_protege
+from stage.utils import traduire_lot
+from stage.translation import traduire_document
+
+
+def test_mask_and_restore_every_kind():
+    protecteur = Protecteur()
+    texte = "Write to john.doe@mail.com or see https://example.com/a before 12/05/2024, {{name}} pays 1,250.50 [Client.Name] ___"
+    masque, valeurs = protecteur.masquer(texte)
+    for valeur in ("john.doe@mail.com", "https://example.com/a", "12/05/2024", "{{name}}", "1,250.50", "[Client.Name]", "___"):
+        assert valeur not in masque
+        assert valeur in valeurs.values()
+    assert Protecteur.restaurer(masque, valeurs) == texte
+
+
+def test_glossary_terms_and_outer_tokens_are_kept():
+    protecteur = Protecteur(glossaire=["Acme Corp", "Acme"])
+    masque, valeurs = protecteur.masquer("⟦0⟧ Acme Corp thanks Acme")
+    assert masque == "⟦0⟧ ⟦1⟧ thanks ⟦2⟧"
+    assert valeurs == {1: "Acme Corp", 2: "Acme"}
+
+
+def test_html_tags_are_not_masked():
+    masque, valeurs = Protecteur().masquer('<span id="12">Page 3</span>', html=True)
+    assert masque == '<span id="12">Page ⟦0⟧</span>'
+    assert valeurs == {0: "3"}
+
+
+def test_fully_protected_segments_are_never_sent(monkeypatch):
+    envoyes = []
+    def faux_appel(textes, *args):
+        envoyes.extend(textes)
+        return [t.upper() for t in textes]
+    monkeypatch.setattr("stage.utils.appel_api_libretranslate_lot", faux_appel)
+
+    stats = {}
+    resultats = traduire_lot(["2024", "john@mail.com", "Page 1", "Page 2"], use_mock=False, stats=stats)
+    assert resultats == ["2024", "john@mail.com", "PAGE 1", "PAGE 2"]
+    assert envoyes == ["Page ⟦0⟧"]  # same text once the numbers are masked, sent once
+    assert stats["segments_proteges"] == 2
+    assert entierement_protege("⟦0⟧ - ⟦1⟧")
+
+
+def test_document_keeps_protected_terms():
+    doc = Document()
+    doc.add_paragraph("Acme signed on 01/02/2025")
+    translated = traduire_document(doc, use_mock=True, termes_proteges=["Acme"])
+    assert translated.paragraphs[0].text == "01/02/2025 no dengis Acme"
+
+
+def test_cache_key_follows_the_protection_settings(monkeypatch):
+    envoyes = []
+    def faux_appel(textes, *args):
+        envoyes.extend(textes)
+        return [t.upper() for t in textes]
+    monkeypatch.setattr("stage.utils.appel_api_libretranslate_lot", faux_appel)
+
+    cache = MemoireTraduction()
+    assert traduire_lot(["Acme is here"], use_mock=False, cache=cache) == ["ACME IS HERE"]
+    # same text, the glossary now keeps "Acme": the cached translation is not reused
+    protecteur = Protecteur(glossaire=["Acme"])
+    assert traduire_lot(["Acme is here"], use_mock=False, cache=cache, protecteur=protecteur) == ["Acme IS HERE"]
+    assert traduire_lot(["Acme is here"], use_mock=False, cache=cache, protecteur=Protecteur(glossaire=["Acme"])) \
+        == ["Acme IS HERE"]
+    assert envoyes == ["Acme is here", "⟦0⟧ is here"]  # the third call is a cache hit
+    assert Protecteur(glossaire=["Acme"]).signature == protecteur.signature != Protecteur().signature
+
+
+def test_lost_tokens_are_reported_and_not_cached(monkeypatch):
+    # the backend drops the token of the first text and doubles the one of the second
+    reponses = {"Call ⟦0⟧ now": "Appelez maintenant", "Room ⟦0⟧": "Salle ⟦0⟧ ⟦0⟧", "Hello": "Bonjour"}
+    monkeypatch.setattr("stage.utils.appel_api_libretranslate_lot", lambda textes, *args: [reponses[t] for t in textes])
+
+    cache, stats = MemoireTraduction(), {}
+    resultats = traduire_lot(["Call 555 now", "Room 12", "Hello"], use_mock=False, cache=cache, stats=stats)
+    assert resultats == ["Call 555 now", "Room 12", "Bonjour"]
+    assert [echec["texte"] for echec in stats["segments_en_echec"]] == ["Call 555 now", "Room 12"]
+    assert cache.get("Room 12", "en", "ar", "libretranslate") is None
+    assert cache.get("Hello", "en", "ar", "libretranslate") == "Bonjour"
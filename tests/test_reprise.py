@@ -0,0 +1,55 @@
+from docx import Document
+
+from stage.reprise import PointDeReprise
+from stage.translation import traduire_document
+
+
+def test_killed_job_resumes_without_paying_twice(tmp_path, monkeypatch):
+    envoyes = []
+    def appel_qui_tombe(textes, *args):
+        if len(envoyes) >= 2:
+            raise KeyboardInterrupt  # the process is killed during the third batch
+        envoyes.extend(textes)
+        return [t.upper() for t in textes]
+    monkeypatch.setattr("stage.utils.appel_api_libretranslate_lot", appel_qui_tombe)
+    chemin = str(tmp_path / "job.reprise.jsonl")
+
+    doc = Document()
+    for texte in ("one", "two", "three", "four"):
+        doc.add_paragraph(texte)
+    try:
+        traduire_document(doc, use_mock=False, taille_lot=1, concurrence=1, reprise=PointDeReprise(chemin))
+    except KeyboardInterrupt:
+        pass
+    with open(chemin, "a", encoding="utf-8") as f:
+        f.write('{"cle": "cut by the ki')  # line cut by the kill
+
+    envoyes.clear()
+    monkeypatch.setattr("stage.utils.appel_api_libretranslate_lot", lambda textes, *args: envoyes.extend(textes) or [t.upper() for t in textes])
+    reprise = PointDeReprise(chemin)
+    stats = {}
+    translated = traduire_document(doc, use_mock=False, taille_lot=1, reprise=reprise, stats=stats)
+
+    assert reprise.repris == 2
+    assert envoyes == ["three", "four"]
+    assert stats["segments_repris"] == 2
+    assert [p.text for p in translated.paragraphs] == ["ONE", "TWO", "THREE", "FOUR"]
+    reprise.supprimer()
+
+
+def test_records_after_a_cut_line_are_kept(tmp_path):
+    chemin = str(tmp_path / "job.reprise.jsonl")
+    reprise = PointDeReprise(chemin)
+    reprise.ajouter_lot(["one", "two"], ["ONE", "TWO"], "en", "ar", "mock")
+    reprise.close()
+    with open(chemin, "a", encoding="utf-8") as f:
+        f.write('{"cle": "cut by the ki')
+
+    reprise = PointDeReprise(chemin)
+    reprise.ajouter_lot(["three"], ["THREE"], "en", "ar", "mock")  # paid for after the resume
+    reprise.close()
+
+    reprise = PointDeReprise(chemin)
+    assert reprise.repris == 3
+    assert reprise.get("three", "en", "ar", "mock") == "THREE"
+    reprise.close()
@@ -0,0 +1,106 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from stage import resilience
+from stage.resilience import Disjoncteur, SeauJetons, CircuitOuvert, attente_adaptative
+from stage.serveur_local import demarrer_serveur
+from stage.utils import appel_api_libretranslate, traduire_lot
+
+
+def erreur_http(code, entetes=None):
+    reponse = requests.Response()
+    reponse.status_code = code
+    reponse.headers.update(entetes or {})
+    return requests.HTTPError(response=reponse)
+
+
+def etat_retry(erreur, tentative):
+    outcome = SimpleNamespace(exception=lambda: erreur)
+    return SimpleNamespace(outcome=outcome, attempt_number=tentative)
+
+
+@pytest.fixture(autouse=True)
+def reglages_rapides(monkeypatch):
+    monkeypatch.setattr(resilience, "ATTENTE_INITIALE", 0.01)
+    monkeypatch.setattr(resilience, "disjoncteur", Disjoncteur(seuil=3, delai=60))
+    monkeypatch.setattr(resilience, "limiteur", SeauJetons())
+
+
+def test_retry_after_is_honored():
+    assert attente_adaptative(etat_retry(erreur_http(429, {"Retry-After": "3"}), 1)) == 3
+
+
+def test_exponential_backoff_with_jitter(monkeypatch):
+    monkeypatch.setattr(resilience, "ATTENTE_INITIALE", 1.0)
+    for tentative, plafond in [(1, 1.0), (2, 2.0), (4, 8.0)]:
+        attente = attente_adaptative(etat_retry(erreur_http(503), tentative))
+        assert plafond / 2 <= attente <= plafond
+
+
+def test_only_transient_errors_are_retried():
+    assert resilience.erreur_reessayable(erreur_http(503))
+    assert resilience.erreur_reessayable(requests.ConnectionError())
+    assert not resilience.erreur_reessayable(erreur_http(400))
+
+
+def test_circuit_breaker_fails_fast():
+    disjoncteur = Disjoncteur(seuil=2, delai=60)
+    disjoncteur.echec()
+    disjoncteur.verifier()                  # still closed
+    disjoncteur.echec()
+    with pytest.raises(CircuitOuvert):
+        disjoncteur.verifier()
+
+
+def test_circuit_breaker_half_open_after_delay():
+    disjoncteur = Disjoncteur(seuil=1, delai=0.05)
+    disjoncteur.echec()
+    time.sleep(0.06)
+    disjoncteur.verifier()                  # one test call allowed
+    with pytest.raises(CircuitOuvert):
+        disjoncteur.verifier()              # but only one
+    disjoncteur.succes()
+    assert disjoncteur.etat == "ferme"
+
+
+def test_token_bucket_limits_rate():
+    seau = SeauJetons(debit=50, capacite=1)
+    debut = time.perf_counter()
+    for _ in range(6):
+        seau.prendre()
+    assert time.perf_counter() - debut >= 5 / 50 * 0.9
+
+
+def test_server_down_segments_are_reported(monkeypatch):
+    serveur = demarrer_serveur(taux_5xx=1.0)
+    monkeypatch.setattr("stage.utils.URL_API", serveur.url)
+    try:
+        stats = {}
+        resultats = traduire_lot(["Hello", "World"], use_mock=False, taille_lot=1, concurrence=1, stats=stats)
+        assert resultats == ["Hello", "World"]                  # kept as is...
+        assert [e["texte"] for e in stats["segments_en_echec"]] == ["Hello", "World"]   # ...but reported
+        assert resilience.disjoncteur.etat == "ouvert"
+        assert serveur.compteurs["requetes"] == 3             # the second batch failed fast, no request
+    finally:
+        serveur.shutdown()
+        serveur.server_close()
+
+
+def test_retry_then_success(monkeypatch):
+    serveur = demarrer_serveur(taux_429=0.5, retry_after=0, graine=1)
+    monkeypatch.setattr("stage.utils.URL_API", serveur.url)
+    try:
+        for _ in range(5):
+            assert appel_api_libretranslate("Hello") == "olleH"
+        assert serveur.compteurs["429"] > 0
+    finally:
+        serveur.shutdown()
+        serveur.server_close()
+
+
+def test_rate_limit_does_not_open_the_circuit():
+    assert not resilience.erreur_panne(erreur_http(429))
+    assert resilience.erreur_panne(erreur_http(502))
@@ -0,0 +1,30 @@
+from docx import Document
+
+from stage.revision import MemoireBlocs
+from stage.translation import traduire_document
+
+
+def test_revised_document_only_sends_changed_blocks(tmp_path, monkeypatch):
+    envoyes = []
+    def faux_appel(textes, *args):
+        envoyes.extend(textes)
+        return [t.upper() for t in textes]
+    monkeypatch.setattr("stage.utils.appel_api_libretranslate_lot", faux_appel)
+    sidecar = str(tmp_path / "doc.blocs.json")
+
+    doc = Document()
+    for texte in ("First block", "Second block", "Third block"):
+        doc.add_paragraph(texte)
+    traduire_document(doc, use_mock=False, blocs=MemoireBlocs(sidecar))
+    assert len(envoyes) == 3
+
+    envoyes.clear()
+    doc.paragraphs[1].text = "Second block, revised"
+    doc.add_paragraph("New block")
+    stats = {}
+    translated = traduire_document(doc, use_mock=False, blocs=MemoireBlocs(sidecar), stats=stats)
+
+    assert envoyes == ["Second block, revised", "New block"]
+    assert [p.text for p in translated.paragraphs] == ["FIRST BLOCK", "SECOND BLOCK, REVISED", "THIRD BLOCK", "NEW BLOCK"]
+    assert stats["blocs"] == 4 and stats["blocs_reutilises"] == 2
+    assert 0 < stats["taux_reutilisation"] < 1
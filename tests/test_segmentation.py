@@ -0,0 +1,57 @@
+from stage.backends import Backend
+from stage.segmentation import decouper_phrases, estimer_jetons
+from stage.utils import decouper_en_lots, traduire_lot
+
+
+def test_long_text_cut_at_sentence_ends_and_rebuilt_exactly():
+    texte = "First sentence here. Second one is a bit longer! Third? " + "word " * 30 + "end."
+    pieces = decouper_phrases(texte, 40)
+    assert "".join(pieces) == texte
+    assert all(len(piece.strip()) <= 40 for piece in pieces)
+    assert pieces[0] == "First sentence here. "  # sentences are packed up to the budget
+    assert decouper_phrases("Short.", 40) == ["Short."]
+
+
+def test_tokens_are_never_cut():
+    texte = "a" * 8 + "⟦12⟧" + "b" * 8
+    pieces = decouper_phrases(texte, 10)
+    assert "".join(pieces) == texte
+    assert not any(("⟦" in piece) != ("⟧" in piece) for piece in pieces)
+    assert decouper_phrases("⟦12⟧abc", 3) == ["⟦12⟧", "abc"]  # a token at the start stays whole
+
+
+def test_token_budget():
+    assert list(decouper_en_lots(["a" * 40] * 4, taille_lot=10, max_caracteres=25, mesure=estimer_jetons)) == [[0, 1], [2, 3]]
+    assert list(decouper_en_lots(["a" * 40] * 4, taille_lot=10, max_caracteres=25, mesure=estimer_jetons,
+                                 max_longueur=50)) == [[0], [1], [2], [3]]
+
+
+def test_token_budget_keeps_the_character_limit_of_the_backend():
+    class PetitBackend(Backend):
+        nom = "petit"
+        max_caracteres = 100
+
+        def traduire(self, textes, format="text", source="en", cible="ar"):
+            envoyes.append(textes)
+            return [t.upper() for t in textes]
+
+    envoyes = []
+    texte = "A short sentence here. " * 20
+    resultat = traduire_lot([texte, "word " * 30], backend=PetitBackend(), mesure=estimer_jetons)
+    assert resultat == [texte.upper(), ("word " * 30).upper()]
+    assert envoyes and all(sum(len(t) for t in textes) <= 100 for textes in envoyes)
+
+
+def test_long_paragraph_sent_in_pieces(monkeypatch):
+    envoyes = []
+    def faux_appel(textes, *args):
+        envoyes.append(textes)
+        return [t.upper() for t in textes]
+    monkeypatch.setattr("stage.utils.appel_api_libretranslate_lot", faux_appel)
+
+    long = "See https://example.com/a.b for details. " * 5
+    stats = {}
+    resultat = traduire_lot([long, "tiny", "run"], use_mock=False, max_caracteres=100, stats=stats)
+    assert resultat == [long.upper().replace("HTTPS://EXAMPLE.COM/A.B", "https://example.com/a.b"), "TINY", "RUN"]
+    assert all(sum(len(t) for t in textes) <= 100 for textes in envoyes)
+    assert stats["requetes"] == len(envoyes) == 2  # the tiny runs ride with the last piece
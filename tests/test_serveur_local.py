@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+from stage.serveur_local import demarrer_serveur
+from stage.utils import traduire_lot, appel_api_libretranslate
+
+
+@pytest.fixture
+def serveur(request, monkeypatch):
+    options = getattr(request, "param", {})
+    serveur = demarrer_serveur(**options)
+    monkeypatch.setattr("stage.utils.URL_API", serveur.url)
+    yield serveur
+    serveur.shutdown()
+    serveur.server_close()
+
+
+def test_single_text_like_libretranslate(serveur):
+    assert appel_api_libretranslate("Hello world") == "dlrow olleH"
+
+
+def test_list_valued_q_through_traduire_lot(serveur):
+    resultats = traduire_lot(["Hello", "World", "Hello"], use_mock=False, taille_lot=1, concurrence=2)
+    assert resultats == ["olleH", "dlroW", "olleH"]
+    assert serveur.compteurs["requetes"] == 2          # "Hello" only sent once
+
+
+@pytest.mark.parametrize("serveur", [{"latence": 0.1}], indirect=True)
+def test_latency_is_added(serveur):
+    debut = time.perf_counter()
+    appel_api_libretranslate("Hello")
+    assert time.perf_counter() - debut >= 0.1
+
+
+@pytest.mark.parametrize("serveur", [{"taux_429": 1.0, "retry_after": 7}], indirect=True)
+def test_429_injection(serveur):
+    import requests
+    reponse = requests.post(serveur.url, json={"q": "Hello", "source": "en", "target": "ar"})
+    assert reponse.status_code == 429
+    assert reponse.headers["Retry-After"] == "7"
+
+
+@pytest.mark.parametrize("serveur", [{"max_caracteres": 5}], indirect=True)
+def test_character_limit(serveur):
+    import requests
+    reponse = requests.post(serveur.url, json={"q": ["Hello", "World"], "source": "en", "target": "ar"})
+    assert reponse.status_code == 400
+
+
+@pytest.mark.parametrize("serveur", [{"max_caracteres": 200}], indirect=True)
+def test_long_paragraph_stays_under_the_server_limit(serveur):
+    long = "This sentence is repeated a few times. " * 20
+    resultats = traduire_lot([long], use_mock=False, max_caracteres=200)
+    assert resultats == ["".join(".semit wef a detaeper si ecnetnes sihT " for _ in range(20))]
+    assert serveur.compteurs["requetes"] == 1  # identical pieces are sent once
@@ -0,0 +1,85 @@
+import http.client
+import threading
+import time
+from io import BytesIO
+
+import pytest
+import requests
+from docx import Document
+
+import stage.service
+from stage.service import demarrer_service
+
+
+def docx(texte):
+    doc = Document()
+    doc.add_paragraph(texte)
+    sortie = BytesIO()
+    doc.save(sortie)
+    return sortie.getvalue()
+
+
+def attendre(service, id_travail):
+    for _ in range(200):
+        etat = requests.get(f"{service.url}/jobs/{id_travail}").json()
+        if etat["statut"] in ("termine", "erreur"):
+            return etat
+        time.sleep(0.02)
+    raise AssertionError("job not finished")
+
+
+@pytest.fixture
+def service(request):
+    service = demarrer_service(**getattr(request, "param", {}))
+    yield service
+    service.arreter()
+
+
+def test_job_is_translated(service):
+    reponse = requests.post(f"{service.url}/jobs", data=docx("Hello world"))
+    assert reponse.status_code == 202
+    etat = attendre(service, reponse.json()["id"])
+    assert etat["statut"] == "termine" and etat["segments"] == 1
+
+    resultat = requests.get(f"{service.url}/jobs/{etat['id']}/resultat")
+    assert Document(BytesIO(resultat.content)).paragraphs[0].text == "dlrow olleH"
+    metriques = requests.get(f"{service.url}/metrics").json()
+    assert metriques["travaux"]["termine"] == 1 and metriques["traitement_ms"]["nombre"] == 1
+
+
+@pytest.mark.parametrize("service", [{"workers": 1, "taille_file": 1}], indirect=True)
+def test_full_queue_is_refused(service, monkeypatch):
+    libre = threading.Event()
+    traduire = stage.service.traduire_document
+    monkeypatch.setattr("stage.service.traduire_document", lambda *a, **k: libre.wait(5) and traduire(*a, **k))
+
+    premier = requests.post(f"{service.url}/jobs", data=docx("one")).json()["id"]
+    for _ in range(100):  # wait until the worker holds the first job
+        if requests.get(f"{service.url}/jobs/{premier}").json()["statut"] == "en_cours":
+            break
+        time.sleep(0.01)
+    assert requests.post(f"{service.url}/jobs", data=docx("two")).status_code == 202  # queued
+    refuse = requests.post(f"{service.url}/jobs", data=docx("three"))
+    assert refuse.status_code == 503 and refuse.headers["Retry-After"]
+    assert requests.get(f"{service.url}/jobs/{premier}/resultat").status_code == 409
+    assert requests.get(f"{service.url}/metrics").json()["file"] == 1
+
+    libre.set()
+    assert attendre(service, premier)["statut"] == "termine"
+
+
+def test_bad_content_length_gets_a_400(service):
+    connexion = http.client.HTTPConnection(*service.server_address)
+    connexion.putrequest("POST", "/jobs")
+    connexion.putheader("Content-Length", "abc")
+    connexion.endheaders()
+    assert connexion.getresponse().status == 400
+    connexion.close()
+
+
+@pytest.mark.parametrize("service", [{"workers": 1, "octets_conserves": 1}], indirect=True)
+def test_kept_results_are_limited_in_bytes(service):
+    premier = attendre(service, requests.post(f"{service.url}/jobs", data=docx("one")).json()["id"])
+    second = attendre(service, requests.post(f"{service.url}/jobs", data=docx("two")).json()["id"])
+    assert requests.get(f"{service.url}/jobs/{premier['id']}").status_code == 404  # forgotten
+    assert requests.get(f"{service.url}/jobs/{second['id']}/resultat").status_code == 200  # the last one is kept
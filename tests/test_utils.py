@@ -1,7 +1,82 @@
 
-from stage.utils import en_majuscule
+from stage.utils import en_majuscule, decouper_en_lots, traduire_lot
+
 
 def test_en_majuscule():
     assert en_majuscule("bonjour") == "BONJOUR"
     assert en_majuscule("Hello World") == "HELLO WORLD"
-    assert en_majuscule("") == ""  # test vide
\ No newline at end of file
+    assert en_majuscule("") == ""  # test vide
+
+
+def test_decouper_en_lots_respects_size_and_characters():
+    textes = ["aaaa", "bbbb", "cccc", "dd", "e"]
+    assert list(decouper_en_lots(textes, taille_lot=2, max_caracteres=100)) == [[0, 1], [2, 3], [4]]
+    assert list(decouper_en_lots(textes, taille_lot=10, max_caracteres=8)) == [[0, 1], [2, 3, 4]]
+    assert list(decouper_en_lots(["a" * 20, "b"], taille_lot=10, max_caracteres=8)) == [[0], [1]]  # too long text goes alone
+
+
+def test_traduire_lot_keeps_order_and_skips_empty():
+    resultats = traduire_lot(["Hello", "  ", "World", ""], use_mock=True, taille_lot=1)
+    assert resultats == ["olleH", "", "dlroW", ""]
+
+
+def test_traduire_lot_one_api_call_per_batch(monkeypatch):
+    appels = []
+    def faux_appel(textes, *args):
+        appels.append(list(textes))
+        return [t.upper() for t in textes]
+    monkeypatch.setattr("stage.utils.appel_api_libretranslate_lot", faux_appel)
+
+    resultats = traduire_lot(["a", "b", "c"], use_mock=False, taille_lot=2)
+    assert resultats == ["A", "B", "C"]
+    assert appels == [["a", "b"], ["c"]]
+
+
+def test_traduire_lot_translates_repeated_segments_once(monkeypatch):
+    appels = []
+    def faux_appel(textes, *args):
+        appels.append(list(textes))
+        return [t.upper() for t in textes]
+    monkeypatch.setattr("stage.utils.appel_api_libretranslate_lot", faux_appel)
+
+    stats = {}
+    resultats = traduire_lot(["Date:", "Signature:", " Date: ", "Date:"], use_mock=False, stats=stats)
+    assert resultats == ["DATE:", "SIGNATURE:", " DATE: ", "DATE:"]   # spaces of each occurrence are kept
+    assert appels == [["Date:", "Signature:"]]
+    assert stats["appels_evites_doublons"] == 2
+
+
+def test_traduire_lot_concurrent_keeps_order(monkeypatch):
+    import threading
+    import time
+    en_cours = []
+    maximum = []
+    verrou = threading.Lock()
+    def faux_appel(textes, *args):
+        with verrou:
+            en_cours.append(1)
+            maximum.append(len(en_cours))
+        time.sleep(0.05)
+        with verrou:
+            en_cours.pop()
+        return [t.upper() for t in textes]
+    monkeypatch.setattr("stage.utils.appel_api_libretranslate_lot", faux_appel)
+
+    textes = [f"text {c}" for c in "abcdefgh"]  # letters: numbers are masked and would share one request
+    resultats = traduire_lot(textes, use_mock=False, taille_lot=1, concurrence=4)
+    assert resultats == [t.upper() for t in textes]
+    assert 1 < max(maximum) <= 4
+
+
+def test_traduire_lot_keeps_tabs_and_line_breaks_inside_a_segment(monkeypatch):
+    appels = []
+    def faux_appel(textes, *args):
+        appels.append(list(textes))
+        return [t.upper() for t in textes]
+    monkeypatch.setattr("stage.utils.appel_api_libretranslate_lot", faux_appel)
+
+    resultats = traduire_lot(["Name:\tJohn Smith", "Name: John  Smith", " Name:\tJohn Smith", "Line one\nline two"],
+                             use_mock=False)
+    assert resultats == ["NAME:\tJOHN SMITH", "NAME: JOHN  SMITH", " NAME:\tJOHN SMITH", "LINE ONE\nLINE TWO"]
+    assert appels == [["Name:\tJohn Smith", "Name: John  Smith", "Line one\nline two"]]  # each whitespace its own
+    assert traduire_lot(["Name:\tJohn Smith"], use_mock=True) == ["htimS nhoJ\t:emaN"]